@@ -36,8 +36,8 @@ def init_driver():
     })
     return driver
 
-# 全局初始化浏览器
-browser = init_driver()
+# 浏览器在 start() 中创建，导入模块时不启动 (控制台任务进程会常驻导入本模块)
+browser = None
 
 def save_cookies():
     """将当前登录状态持久化到本地文件"""
@@ -174,10 +174,12 @@ import json
 
 def start():
     """主程序入口：读取 CSV 并分发任务"""
+    global browser
     with open("app_config.json", "r", encoding="utf-8") as f:
         conf = json.load(f)
     GAP = int(conf.get("publish_gap", 45))
     
+    browser = init_driver()
     try:
         login()
         if not os.path.exists(CSV_PATH):
@@ -214,6 +216,7 @@ def start():
                 time.sleep(10)
     finally:
         browser.quit()
+        browser = None
         print("\n>>> 脚本运行结束")
 
 if __name__ == "__main__":
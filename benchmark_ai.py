@@ -0,0 +1,246 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageDraw
+
+from mock_dashscope import MockConfig, start_server
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[k]
+
+
+def draw_comic(path, rows, cols, seed, size=(900, 1200), gutter=20):
+    """绘制一张合成漫画：rows x cols 个带边框的格子，格内随机图形"""
+    rng = random.Random(seed)
+    img = Image.new("RGB", size, (255, 255, 255))
+    d = ImageDraw.Draw(img)
+    w, h = size
+    pw, ph = (w - gutter * (cols + 1)) / cols, (h - gutter * (rows + 1)) / rows
+    for r in range(rows):
+        for c in range(cols):
+            x, y = gutter + c * (pw + gutter), gutter + r * (ph + gutter)
+            d.rectangle([x, y, x + pw, y + ph], outline=(0, 0, 0), width=4)
+            for _ in range(25):
+                a, b = rng.uniform(x + 8, x + pw - 40), rng.uniform(y + 8, y + ph - 40)
+                color = tuple(rng.randrange(0, 230) for _ in range(3))
+                d.ellipse([a, b, a + rng.uniform(10, 30), b + rng.uniform(10, 30)], fill=color)
+    img.save(path, "JPEG", quality=90)
+
+
+# 合成素材首图版式在 2x3 / 3x2 / 单格 / 2x2 之间轮换
+LAYOUTS = [(2, 3), (3, 2), (1, 1), (2, 2)]
+
+
+def is_six_panel_note(n):
+    """第 n 条合成笔记的首图是否为六格 (用作准确率的真值)"""
+    rows, cols = LAYOUTS[n % len(LAYOUTS)]
+    return rows * cols == 6
+
+
+def build_corpus(root, notes, frames):
+    """生成 note_N/1..frames.jpg 的合成素材库"""
+    folders = []
+    for n in range(1, notes + 1):
+        folder = os.path.join(root, f"note_{n}")
+        os.makedirs(folder, exist_ok=True)
+        for i in range(1, frames + 1):
+            rows, cols = LAYOUTS[n % len(LAYOUTS)] if i == 1 else (1, 1)
+            draw_comic(os.path.join(folder, f"{i}.jpg"), rows, cols, seed=n * 100 + i)
+        folders.append(folder)
+    return folders
+
+
+def summarize(name, latencies, elapsed, before, after):
+    calls = len(latencies)
+    return {
+        "stage": name,
+        "calls": calls,
+        "calls_per_sec": round(calls / elapsed, 2) if elapsed else 0.0,
+        "p50": round(percentile(latencies, 50), 3),
+        "p99": round(percentile(latencies, 99), 3),
+        "bytes_sent": after["bytes_in"] - before["bytes_in"],
+        "http_requests": after["requests"] - before["requests"],
+        "rate_limited": after["rate_limited"] - before["rate_limited"],
+        "server_errors": after["errors"] - before["errors"],
+    }
+
+
+def bench_classify(spider, state, urls, concurrency, mode="sync", cache=None):
+    """六格识别阶段：sync 为线程池并发调用，async 为 AsyncRunner 并发调用"""
+    from dashscope_client import AsyncRunner
+    api_key = os.getenv("DASHSCOPE_API_KEY")
+    latencies = []
+    before = state.snapshot()
+    start = time.time()
+    if mode == "async":
+        async def timed(url):
+            t = time.time()
+            await spider.is_six_panel_comic_async(url, api_key)
+            latencies.append(time.time() - t)
+        runner = AsyncRunner(concurrency)
+        for f in [runner.submit(timed, u) for u in urls]:
+            f.result()
+        runner.close()
+    else:
+        fetcher = spider.ImageFetcher() if cache is not None else None
+
+        def timed(url):
+            t = time.time()
+            spider.is_six_panel_comic(url, api_key, fetcher, cache)
+            latencies.append(time.time() - t)
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(timed, urls))
+    label = f"classify[{mode}{'+cache' if cache is not None else ''}] x{concurrency}"
+    return summarize(label, latencies, time.time() - start, before, state.snapshot())
+
+
+def bench_packed(spider, state, urls, labels, batch_size, concurrency, reference=None):
+    """
+    打包识别阶段：多个调用方同时提交，由 PackedClassifier 凑批后请求
+    返回 (结果行, 判定列表)；batch_size=1 即逐张识别，其判定作为 reference 计算一致率
+    """
+    api_key = os.getenv("DASHSCOPE_API_KEY")
+    packer = spider.PackedClassifier(api_key, batch_size, max_wait=0.5, concurrency=concurrency)
+    latencies = []
+    before = state.snapshot()
+    fallback = spider.packed_stats["fallback"]
+    start = time.time()
+
+    def timed(url):
+        t = time.time()
+        verdict = packer.submit(url).result()
+        latencies.append(time.time() - t)
+        return verdict
+    with ThreadPoolExecutor(max_workers=batch_size * concurrency) as pool:
+        verdicts = list(pool.map(timed, urls))
+    packer.close()
+    row = summarize(f"classify[packed={batch_size}] x{concurrency}", latencies, time.time() - start,
+                    before, state.snapshot())
+    row["accuracy"] = round(sum(v == y for v, y in zip(verdicts, labels)) / len(urls), 3)
+    if reference is not None:
+        row["agreement"] = round(sum(v == r for v, r in zip(verdicts, reference)) / len(urls), 3)
+    row["fallback"] = spider.packed_stats["fallback"] - fallback
+    return row, verdicts
+
+
+def bench_story(rewrite_images, state, folders, workers, cache=None, encoder=None):
+    """故事改写阶段：线程池并发调用 generate_batch_story"""
+    latencies = []
+    before = state.snapshot()
+    start = time.time()
+
+    def timed(folder):
+        paths = [os.path.join(folder, n) for n in rewrite_images.list_images(folder)]
+        t = time.time()
+        rewrite_images.generate_batch_story(paths, encoder=encoder, cache=cache)
+        latencies.append(time.time() - t)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(timed, folders))
+    label = f"story[{'encoded' if encoder else 'raw'}{'+cache' if cache is not None else ''}] x{workers}"
+    return summarize(label, latencies, time.time() - start, before, state.snapshot())
+
+
+def print_table(rows):
+    cols = ["stage", "calls", "calls_per_sec", "p50", "p99", "bytes_sent", "http_requests", "rate_limited", "server_errors"]
+    # 打包识别阶段额外输出准确率 / 与逐张识别的一致率 / 回退张数
+    cols += [c for c in ("accuracy", "agreement", "fallback") if any(c in r for r in rows)]
+    widths = [max(len(c), *(len(str(r.get(c, "-"))) for r in rows)) for c in cols]
+    print("  ".join(c.ljust(w) for c, w in zip(cols, widths)))
+    for r in rows:
+        print("  ".join(str(r.get(c, "-")).ljust(w) for c, w in zip(cols, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AI 阶段离线基准测试（本地模拟服务）")
+    parser.add_argument("--notes", type=int, default=20, help="合成笔记数量")
+    parser.add_argument("--frames", type=int, default=6, help="每条笔记的图片数")
+    parser.add_argument("--concurrency", default="1,4,8", help="逗号分隔的并发数列表")
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rps", type=float, default=0.0)
+    parser.add_argument("--bad-format-rate", type=float, default=0.0)
+    parser.add_argument("--packed-bad-rate", type=float, default=0.0, help="多图识别回复漏答一张的概率")
+    parser.add_argument("--batch-sizes", default="2,4,6", help="打包识别阶段逗号分隔的每批图片数")
+    parser.add_argument("--client-rpm", type=int, default=0, help="调度器每分钟请求上限，0 表示不限")
+    parser.add_argument("--stages", default="classify,packed,story", help="要测试的阶段")
+    parser.add_argument("--json", default=None, help="结果另存为 JSON 文件")
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    workdir = tempfile.mkdtemp(prefix="ai_bench_")
+    corpus = os.path.join(workdir, "corpus")
+    print(f"[Bench] 生成合成素材: {args.notes} 条笔记 x {args.frames} 帧 -> {corpus}")
+    folders = build_corpus(corpus, args.notes, args.frames)
+
+    cfg = MockConfig(args.latency, args.jitter, args.error_rate, args.rps,
+                     bad_format_rate=args.bad_format_rate, image_dir=corpus,
+                     packed_bad_rate=args.packed_bad_rate)
+    server, state, base_url = start_server(cfg)
+    # 必须在导入业务模块之前设置，共享客户端在导入时读取 base URL
+    os.environ["DASHSCOPE_BASE_URL"] = base_url
+    os.environ.setdefault("DASHSCOPE_API_KEY", "mock-key")
+    os.environ["DASHSCOPE_RPM"] = str(args.client_rpm)
+    # 业务模块会在当前目录创建缓存文件，切到临时目录避免污染工作区
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(workdir)
+    from model_cache import ModelCache
+
+    levels = [int(c) for c in args.concurrency.split(",") if c.strip()]
+    stages = args.stages.split(",")
+    host = base_url.rsplit("/v1", 1)[0]
+    rows = []
+    try:
+        if "classify" in stages:
+            import spider
+            urls = [f"{host}/images/note_{n}/1.jpg" for n in range(1, args.notes + 1)]
+            for c in levels:
+                rows.append(bench_classify(spider, state, urls, c, "sync"))
+                rows.append(bench_classify(spider, state, urls, c, "async"))
+            cache = ModelCache(os.path.join(workdir, "verdict_bench.db"))
+            rows.append(bench_classify(spider, state, urls, levels[-1], "sync", cache))
+            rows.append(bench_classify(spider, state, urls, levels[-1], "sync", cache))
+        if "packed" in stages:
+            import spider
+            urls = [f"{host}/images/note_{n}/1.jpg" for n in range(1, args.notes + 1)]
+            labels = [is_six_panel_note(n) for n in range(1, args.notes + 1)]
+            row, reference = bench_packed(spider, state, urls, labels, 1, levels[-1])
+            rows.append(row)
+            for size in [int(s) for s in args.batch_sizes.split(",") if s.strip()]:
+                rows.append(bench_packed(spider, state, urls, labels, size, levels[-1], reference)[0])
+        if "story" in stages:
+            import rewrite_images
+            for c in levels:
+                rows.append(bench_story(rewrite_images, state, folders, c))
+            rows.append(bench_story(rewrite_images, state, folders, levels[-1], encoder=rewrite_images.encoder))
+            cache = ModelCache(os.path.join(workdir, "story_bench.db"))
+            rows.append(bench_story(rewrite_images, state, folders, levels[-1], cache=cache, encoder=rewrite_images.encoder))
+            rows.append(bench_story(rewrite_images, state, folders, levels[-1], cache=cache, encoder=rewrite_images.encoder))
+    finally:
+        server.shutdown()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    print_table(rows)
+    from dashscope_client import scheduler
+    print(scheduler.report())
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+
+import openai
+
+
+class ModelUnavailable(Exception):
+    """重试耗尽后仍无法得到模型结果"""
+
+
+class TokenBucket:
+    """令牌桶：rate 为每秒补充量，capacity 为桶容量；允许透支，透支部分由后续请求等待偿还"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount):
+        """预扣 amount，返回需要等待的秒数"""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            self._refill()
+            self.level -= amount
+            return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def adjust(self, delta):
+        """按实际用量修正预扣量（delta 为正表示多用）"""
+        if not self.rate:
+            return
+        with self._lock:
+            self._refill()
+            self.level -= delta
+
+
+class CircuitBreaker:
+    """
+    连续失败达到阈值后熔断 cooldown 秒
+    熔断期间调用方暂停等待而不是直接放行；冷却结束后只要再失败一次就重新熔断
+    """
+
+    def __init__(self, threshold=5, cooldown=30):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.open_until = 0.0
+        self.trips = 0
+        self._lock = threading.Lock()
+
+    def wait_time(self):
+        return max(0.0, self.open_until - time.monotonic())
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold and self.wait_time() == 0:
+                self.open_until = time.monotonic() + self.cooldown
+                self.failures = self.threshold - 1  # 半开：冷却后再失败一次即重新熔断
+                self.trips += 1
+                print(f"[Scheduler] 连续失败 {self.threshold} 次，暂停调用 {self.cooldown}s")
+
+
+class CallScheduler:
+    """
+    所有 DashScope 请求共用的调度器：
+    - 请求数 / Token 数两个令牌桶限速 (rpm / tpm)
+    - 429、超时、连接错误、5xx 按带抖动的指数退避重试，429 优先遵循 Retry-After
+    - 熔断器：持续失败时暂停所有调用，而不是把失败当作通过
+    """
+
+    RETRYABLE = (openai.RateLimitError, openai.APITimeoutError, openai.APIConnectionError,
+                 openai.InternalServerError)
+
+    def __init__(self, rpm=60, tpm=0, max_retries=5, base_delay=1.0, max_delay=30.0,
+                 failure_threshold=5, cooldown=30, default_tokens=1000):
+        self.requests = TokenBucket(rpm / 60.0, max(1, rpm // 6)) if rpm else TokenBucket(0, 0)
+        self.tokens = TokenBucket(tpm / 60.0, max(1, tpm // 6)) if tpm else TokenBucket(0, 0)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.default_tokens = default_tokens
+        self.breaker = CircuitBreaker(failure_threshold, cooldown)
+        self._lock = threading.Lock()
+        self._done = deque()  # 最近一小时成功调用的时间戳
+        self.started = time.monotonic()
+        self.stats = {"calls": 0, "attempts": 0, "rate_limited": 0, "retries": 0, "failed": 0}
+
+    # --- 内部工具 ---
+    def _is_retryable(self, e):
+        if isinstance(e, self.RETRYABLE):
+            return True
+        return isinstance(e, openai.APIStatusError) and e.status_code >= 500
+
+    def _backoff(self, attempt, e):
+        """第 attempt 次重试前的等待时间"""
+        if isinstance(e, openai.RateLimitError):
+            try:
+                retry_after = float(e.response.headers.get("retry-after", ""))
+                return retry_after + random.uniform(0, 0.5)
+            except (AttributeError, TypeError, ValueError):
+                pass
+        delay = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return random.uniform(delay / 2, delay)  # 抖动，避免多个线程同时重试
+
+    def _admission(self, est_tokens):
+        """返回开始请求前需要等待的秒数（限速 + 熔断）"""
+        return max(self.breaker.wait_time(), self.requests.reserve(1), self.tokens.reserve(est_tokens))
+
+    def _on_attempt(self):
+        with self._lock:
+            self.stats["attempts"] += 1
+
+    def _on_success(self, result, est_tokens):
+        self.breaker.success()
+        usage = getattr(result, "usage", None)
+        if usage is not None and getattr(usage, "total_tokens", None):
+            self.tokens.adjust(usage.total_tokens - est_tokens)
+        now = time.monotonic()
+        with self._lock:
+            self.stats["calls"] += 1
+            self._done.append(now)
+            while self._done and now - self._done[0] > 3600:
+                self._done.popleft()
+
+    def _on_error(self, e, attempt):
+        """记录一次失败，返回重试前的等待秒数；不可重试或重试耗尽时抛出异常"""
+        if not self._is_retryable(e):
+            raise e
+        with self._lock:
+            if isinstance(e, openai.RateLimitError):
+                self.stats["rate_limited"] += 1
+            if attempt >= self.max_retries:
+                self.stats["failed"] += 1
+        self.breaker.failure()
+        if attempt >= self.max_retries:
+            raise ModelUnavailable(f"重试 {self.max_retries} 次后仍失败: {e}") from e
+        with self._lock:
+            self.stats["retries"] += 1
+        return self._backoff(attempt, e)
+
+    # --- 对外接口 ---
+    def call(self, fn, *args, est_tokens=None, **kwargs):
+        """同步调用 fn(*args, **kwargs)，自动限速、退避重试、熔断等待"""
+        est = self.default_tokens if est_tokens is None else est_tokens
+        for attempt in range(self.max_retries + 1):
+            time.sleep(self._admission(est if attempt == 0 else 0))
+            self._on_attempt()
+            try:
+                result = fn(*args, **kwargs)
+            except Exception as e:
+                time.sleep(self._on_error(e, attempt))
+                continue
+            self._on_success(result, est)
+            return result
+
+    async def acall(self, coro_fn, *args, est_tokens=None, **kwargs):
+        """call 的异步版本"""
+        est = self.default_tokens if est_tokens is None else est_tokens
+        for attempt in range(self.max_retries + 1):
+            await asyncio.sleep(self._admission(est if attempt == 0 else 0))
+            self._on_attempt()
+            try:
+                result = await coro_fn(*args, **kwargs)
+            except Exception as e:
+                await asyncio.sleep(self._on_error(e, attempt))
+                continue
+            self._on_success(result, est)
+            return result
+
+    def per_minute(self):
+        """返回 (最近一分钟调用数, 运行期间平均每分钟调用数)"""
+        now = time.monotonic()
+        with self._lock:
+            last = sum(1 for t in self._done if now - t <= 60)
+        minutes = max((now - self.started) / 60.0, 1 / 60.0)
+        return last, self.stats["calls"] / minutes
+
+    def reset_stats(self):
+        """清零统计，常驻进程中每次运行开始时调用，报告只反映本次运行"""
+        with self._lock:
+            self._done.clear()
+            self.started = time.monotonic()
+            self.stats = dict.fromkeys(self.stats, 0)
+        self.breaker.trips = 0
+
+    def report(self):
+        last, avg = self.per_minute()
+        attempts = max(self.stats["attempts"], 1)
+        return (f"[Scheduler] 成功 {self.stats['calls']} 次 | 最近 1 分钟 {last} 次, 平均 {avg:.1f} 次/分 | "
+                f"限流 429 {self.stats['rate_limited']} 次 ({self.stats['rate_limited'] / attempts:.1%}) | "
+                f"重试 {self.stats['retries']} 次 | 失败 {self.stats['failed']} 次 | 熔断 {self.breaker.trips} 次")
@@ -0,0 +1,86 @@
+import os
+import re
+import csv
+import time
+import sqlite3
+import threading
+
+# 笔记 ID 为 24 位十六进制，链接中的 xsec_token 等参数每次会话都会变化，不能作为键
+NOTE_ID_RE = re.compile(r'[0-9a-f]{24}')
+
+
+def note_key(href):
+    """从笔记链接中提取稳定的笔记 ID，提取失败时退化为去掉参数的路径"""
+    m = NOTE_ID_RE.search(href or "")
+    return m.group(0) if m else (href or "").split('?')[0]
+
+
+def next_note_index(save_path):
+    """根据已有 metadata.csv 与 note_N 文件夹推算下一个可用序号"""
+    last = 0
+    csv_path = os.path.join(save_path, 'metadata.csv')
+    if os.path.exists(csv_path):
+        with open(csv_path, 'r', encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                try:
+                    last = max(last, int(row['序号']))
+                except (KeyError, TypeError, ValueError):
+                    continue
+    if os.path.isdir(save_path):
+        for entry in os.scandir(save_path):
+            m = re.fullmatch(r'note_(\d+)', entry.name)
+            if m and entry.is_dir():
+                last = max(last, int(m.group(1)))
+    return last
+
+
+class CrawlState:
+    """
+    跨运行持久化的笔记访问记录
+    - accepted / rejected：已有定论，后续运行直接跳过
+    - failed：下载失败等临时问题，后续运行会重试
+    - skipped：仅由本地预筛否定，没有模型确认，后续运行会重新判断
+    """
+
+    FINAL = ("accepted", "rejected")
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS notes (
+                note_id    TEXT PRIMARY KEY,
+                href       TEXT,
+                status     TEXT NOT NULL,
+                reason     TEXT,
+                note_idx   INTEGER,
+                updated_at REAL NOT NULL
+            )""")
+        self.db.commit()
+        # 启动时一次性载入已有定论的笔记，之后的判断只查内存集合
+        self.done = {r[0] for r in self.db.execute(
+            "SELECT note_id FROM notes WHERE status IN (?, ?)", self.FINAL)}
+        self.stats = {"skipped": 0}
+
+    def __len__(self):
+        return len(self.done)
+
+    def is_done(self, href):
+        if note_key(href) in self.done:
+            self.stats["skipped"] += 1
+            return True
+        return False
+
+    def record(self, href, status, reason=None, note_idx=None):
+        key = note_key(href)
+        with self._lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO notes VALUES (?, ?, ?, ?, ?, ?)",
+                (key, href, status, reason, note_idx, time.time()))
+            self.db.commit()
+            if status in self.FINAL:
+                self.done.add(key)
+
+    def close(self):
+        with self._lock:
+            self.db.close()
@@ -0,0 +1,98 @@
+import os
+import asyncio
+import threading
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+
+from call_scheduler import CallScheduler
+
+# 阿里云百炼 OpenAI 兼容接口地址，可通过环境变量切换（如本地调试服务）
+BASE_URL = os.getenv("DASHSCOPE_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
+
+# 连接池参数：复用 TLS 连接，避免每次调用重新握手
+POOL_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=16, keepalive_expiry=120)
+TIMEOUT = httpx.Timeout(120.0, connect=10.0)
+
+# 所有 DashScope 请求共用的限速 / 重试 / 熔断调度器 (重试由调度器负责，客户端自身不再重试)
+scheduler = CallScheduler(
+    rpm=int(os.getenv("DASHSCOPE_RPM", "60")),
+    tpm=int(os.getenv("DASHSCOPE_TPM", "0")),
+    max_retries=int(os.getenv("DASHSCOPE_MAX_RETRIES", "5")),
+)
+
+_clients = {}
+_async_clients = {}
+_lock = threading.Lock()
+
+
+def get_client(api_key=None):
+    """进程内共享的同步客户端（按 API Key 复用，线程安全）"""
+    api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
+    with _lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = OpenAI(
+                api_key=api_key,
+                base_url=BASE_URL,
+                max_retries=0,
+                http_client=httpx.Client(limits=POOL_LIMITS, timeout=TIMEOUT),
+            )
+            _clients[api_key] = client
+        return client
+
+
+def get_async_client(api_key=None):
+    """
+    当前事件循环内共享的异步客户端
+    httpx 的异步连接池绑定在创建它的事件循环上，因此按 (API Key, 事件循环) 复用
+    """
+    api_key = api_key or os.getenv("DASHSCOPE_API_KEY")
+    key = (api_key, id(asyncio.get_running_loop()))
+    with _lock:
+        client = _async_clients.get(key)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=api_key,
+                base_url=BASE_URL,
+                max_retries=0,
+                http_client=httpx.AsyncClient(limits=POOL_LIMITS, timeout=TIMEOUT),
+            )
+            _async_clients[key] = client
+        return client
+
+
+class AsyncRunner:
+    """
+    后台事件循环线程 + 并发上限
+    同步代码通过 submit 提交协程，立即拿到 concurrent.futures.Future，不阻塞调用方
+    """
+
+    def __init__(self, concurrency=4):
+        self.concurrency = concurrency
+        self.loop = asyncio.new_event_loop()
+        self._sem = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self._sem = asyncio.Semaphore(self.concurrency)
+        self.loop.run_forever()
+
+    async def _limited(self, coro_fn, args, kwargs):
+        async with self._sem:
+            return await coro_fn(*args, **kwargs)
+
+    def submit(self, coro_fn, *args, **kwargs):
+        return asyncio.run_coroutine_threadsafe(self._limited(coro_fn, args, kwargs), self.loop)
+
+    def close(self):
+        async def _shutdown():
+            key_loop = id(self.loop)
+            for key in [k for k in _async_clients if k[1] == key_loop]:
+                await _async_clients.pop(key).close()
+        if self.loop.is_running():
+            asyncio.run_coroutine_threadsafe(_shutdown(), self.loop).result(timeout=10)
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout=10)
@@ -2,6 +2,7 @@ import time
 import json
 import csv
 import os
+import argparse
 import traceback
 from selenium import webdriver
 from selenium.webdriver.common.by import By
@@ -9,10 +10,20 @@ from selenium.webdriver.support.wait import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.service import Service
 from webdriver_manager.chrome import ChromeDriverManager
+from stats_store import StatsStore, record_key
+from task_worker import progress
+from tracer import span
 
 # 配置文件路径
 COOKIES_PATH = "cookies.json"
 STATS_CSV_PATH = "interaction_data.csv"
+STATS_DB_PATH = "interaction_stats.db"   # 只追加的历史快照库
+
+# 增量采集参数
+HARVEST_POLL = 0.5          # 每轮提取间隔 (秒)
+HARVEST_IDLE = 6            # 超过该秒数没有新笔记渲染出来视为到底
+RECENT_HOURS = 6            # 该时间内采集过的笔记视为「最近采集」
+STOP_AFTER_RECENT = 10      # 连续遇到这么多条最近采集过的笔记时提前结束
 
 def init_driver():
     """初始化浏览器驱动"""
@@ -37,9 +48,119 @@ def load_cookies(driver):
     driver.refresh()
     return True
 
-def get_stats():
-    """获取小红书笔记数据"""
+# 页面标题、标签页等非笔记文本
+SKIP_TITLES = {"全部笔记", "已发布", "审核中", "未通过", "笔记管理"}
+
+# 在页面内一次性提取所有笔记行，返回 [{title, counts, publish, note_id}] 的 JSON 字符串
+EXTRACT_NOTES_JS = r"""
+const COUNT_RE = /^(\d[\d,]*(\.\d+)?\s*[wW万kK]?)$/;
+const ID_RE = /[0-9a-f]{24}/;
+const ownText = el => Array.from(el.childNodes)
+    .filter(n => n.nodeType === Node.TEXT_NODE).map(n => n.textContent).join('').trim();
+const counts = row => Array.from(row.querySelectorAll('span'))
+    .map(s => s.innerText.trim()).filter(t => COUNT_RE.test(t));
+
+// 以包含「发布于」的元素为锚点，向上找到第一个带有互动数据的容器作为笔记行
+const rows = new Set();
+for (const el of document.querySelectorAll('div, span')) {
+    if (!ownText(el).includes('发布于')) continue;
+    let row = el.parentElement;
+    while (row && row !== document.body && counts(row).length < 2) row = row.parentElement;
+    if (row && row !== document.body) rows.add(row);
+}
+
+const out = [];
+for (const row of rows) {
+    const titleEl = row.querySelector("div[class*='title'], span[class*='title']")
+        || Array.from(row.querySelectorAll('div')).find(d => ownText(d).length > 2 && !ownText(d).includes('发布于'));
+    const pubEl = Array.from(row.querySelectorAll('div, span')).find(d => ownText(d).includes('发布于'));
+    // 笔记 ID：优先取链接，其次取 data-* 属性中的 24 位十六进制串
+    let noteId = '';
+    for (const el of [row, ...row.querySelectorAll('*')]) {
+        for (const attr of el.attributes) {
+            const m = (attr.name === 'href' || attr.name.startsWith('data-')) && attr.value.match(ID_RE);
+            if (m) { noteId = m[0]; break; }
+        }
+        if (noteId) break;
+    }
+    out.push({
+        title: titleEl ? titleEl.innerText.trim() : '',
+        counts: counts(row),
+        publish: pubEl ? ownText(pubEl).replace('发布于', '').trim() : '',
+        note_id: noteId,
+    });
+}
+// 传入 true 时滚动到最后一行，触发下一批渲染 / 懒加载
+if (arguments[0]) {
+    const last = Array.from(rows).pop();
+    if (last) last.scrollIntoView({block: 'end'});
+    window.scrollTo(0, document.body.scrollHeight);
+}
+return JSON.stringify(out);
+"""
+
+def parse_note_rows(raw):
+    """解析 EXTRACT_NOTES_JS 返回的 JSON，按笔记 ID (缺失时按标题) 去重"""
+    results = {}
+    captured = time.strftime("%Y-%m-%d %H:%M:%S")
+    for item in json.loads(raw or "[]"):
+        title = (item.get("title") or "").strip()
+        # 跳过页面标题和空标题
+        if not title or title in SKIP_TITLES:
+            continue
+        counts = item.get("counts") or []
+        # 小红书数据顺序固定：阅读、点赞、收藏、评论、分享
+        if len(counts) < 2:
+            continue
+        counts = (counts + ["0"] * 5)[:5]
+        results[item.get("note_id") or title] = {
+            "笔记ID": item.get("note_id") or "",
+            "标题": title,
+            "阅读": counts[0],
+            "点赞": counts[1],
+            "收藏": counts[2],
+            "评论": counts[3],
+            "分享": counts[4],
+            "发布时间": item.get("publish") or "",
+            "采集时间": captured,
+        }
+    return results
+
+def harvest_rows(driver, recent=None, recent_secs=RECENT_HOURS * 3600):
+    """
+    边滚动边提取：每轮一次 execute_script 提取当前已渲染的笔记并滚动到最后一行，只处理新出现的笔记
+    - recent 为 {笔记键: 最近采集时间}，连续 STOP_AFTER_RECENT 条笔记都在 recent_secs 内采集过时提前结束
+    - 超过 HARVEST_IDLE 秒没有新笔记出现视为已到列表底部
+    返回 (采集结果, 是否提前结束)
+    """
+    recent = recent or {}
+    results, streak = {}, 0
+    now = idle_since = time.time()
+    while True:
+        with span("dom_extract"):
+            batch = parse_note_rows(driver.execute_script(EXTRACT_NOTES_JS, True))
+        fresh = [(k, r) for k, r in batch.items() if k not in results]
+        for k, r in fresh:
+            results[k] = r
+            streak = streak + 1 if now - recent.get(record_key(r), 0) < recent_secs else 0
+            if streak >= STOP_AFTER_RECENT:
+                print(f"⏹️ 连续 {streak} 条笔记在 {recent_secs / 3600:g} 小时内已采集过，提前结束")
+                return results, True
+        if fresh:
+            idle_since = time.time()
+            print(f"  已提取 {len(results)} 篇笔记...")
+            progress(len(results), None, "回爬")
+        elif time.time() - idle_since > HARVEST_IDLE:
+            return results, False
+        time.sleep(HARVEST_POLL)
+
+def get_stats(full=False):
+    """
+    获取小红书笔记数据
+    默认增量采集：遇到最近采集过的笔记即停止滚动；full=True 时滚动到列表底部
+    """
     driver = init_driver()
+    store = None
     try:
         if not load_cookies(driver): return
 
@@ -49,64 +170,27 @@ def get_stats():
         # 等待页面加载完成
         wait = WebDriverWait(driver, 20)
         # 以"发布于"文字作为页面加载完成的标识
-        wait.until(EC.presence_of_element_located((By.XPATH, "//*[contains(text(), '发布于')]")))
-        time.sleep(5)  # 额外等待确保动态内容加载
+        with span("dom_wait"):
+            wait.until(EC.presence_of_element_located((By.XPATH, "//*[contains(text(), '发布于')]")))
 
-        # 定位所有笔记行
-        # 通过查找包含"发布于"的div来定位笔记条目
+        # 每轮一次 execute_script 提取已渲染的笔记并继续滚动，避免逐行、逐元素的 WebDriver 往返
         print("📊 开始查找笔记...")
-        note_rows = driver.find_elements(By.XPATH, "//div[.//div[contains(text(), '发布于')]]")
-        
-        # 存储解析结果
-        results = {}
-
-        for row in note_rows:
-            try:
-                # 提取笔记标题
-                # 先尝试查找标题类元素，如果没有再查找长文本
-                title_els = row.find_elements(By.XPATH, ".//div[contains(@class, 'title')] | .//span[contains(@class, 'title')]")
-                if not title_els:
-                    title_els = row.find_elements(By.XPATH, ".//div[string-length(text()) > 2]")
-                
-                if not title_els: continue
-                title = title_els[0].text.strip()
-                
-                # 跳过页面标题和空标题
-                if title in ["全部笔记", "已发布", "审核中", "未通过", "笔记管理"] or not title:
-                    continue
-
-                # 提取互动数据
-                # 查找所有span元素，筛选出数字或带w的数据
-                all_spans = row.find_elements(By.TAG_NAME, "span")
-                counts = []
-                for s in all_spans:
-                    txt = s.text.strip()
-                    # 匹配纯数字或带w的单位
-                    if txt.isdigit() or (len(txt) > 1 and txt[:-1].replace('.','').isdigit() and txt[-1].lower() == 'w'):
-                        counts.append(txt)
-                
-                # 小红书数据顺序固定：阅读、点赞、收藏、评论、分享
-                if len(counts) >= 2:
-                    results[title] = {
-                        "标题": title,
-                        "阅读": counts[0] if len(counts) > 0 else "0",
-                        "点赞": counts[1] if len(counts) > 1 else "0",
-                        "收藏": counts[2] if len(counts) > 2 else "0",
-                        "评论": counts[3] if len(counts) > 3 else "0",
-                        "分享": counts[4] if len(counts) > 4 else "0",
-                        "采集时间": time.strftime("%Y-%m-%d %H:%M:%S")
-                    }
-            except:
-                continue
+        store = StatsStore(STATS_DB_PATH)
+        results, stopped_early = harvest_rows(driver, None if full else store.last_seen())
 
         # 保存并显示结果
         if results:
             data_list = list(results.values())
+            # 历史快照只追加不覆盖，计数未变化的笔记不重复写入
+            with span("store", notes=len(data_list)):
+                added, unchanged = store.append(data_list)
+            # interaction_data.csv 保存每篇笔记的最新数据，提前结束时未滚动到的笔记沿用历史快照
+            rows = store.latest_records() if stopped_early else data_list
             with open(STATS_CSV_PATH, "w", encoding="utf-8-sig", newline="") as f:
                 writer = csv.DictWriter(f, fieldnames=data_list[0].keys())
                 writer.writeheader()
-                writer.writerows(data_list)
-            print(f"✅ 成功采集 {len(data_list)} 篇笔记数据")
+                writer.writerows(rows)
+            print(f"✅ 成功采集 {len(data_list)} 篇笔记数据 (新增快照 {added} 条, 未变化 {unchanged} 条)")
             for r in data_list:
                 print(f"  - {r['标题'][:12]}: 阅 {r['阅读']}, 赞 {r['点赞']}, 藏 {r['收藏']}")
         else:
@@ -117,7 +201,11 @@ def get_stats():
     except Exception:
         traceback.print_exc()
     finally:
+        if store is not None:
+            store.close()
         driver.quit()
 
 if __name__ == "__main__":
-    get_stats()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="回爬创作者中心笔记互动数据")
+    parser.add_argument("--full", action="store_true", help="滚动到列表底部，不因最近采集过而提前结束")
+    get_stats(parser.parse_args().full)
\ No newline at end of file
@@ -0,0 +1,88 @@
+import os
+import base64
+import hashlib
+import threading
+from io import BytesIO
+from PIL import Image
+
+MIME = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+class PayloadEncoder:
+    """
+    发送给多模态模型前的图片预处理：
+    - 按最长边等比缩小，重新编码为指定质量的 JPEG / WebP
+    - 编码结果按 (原图内容哈希 + 编码参数) 缓存到磁盘，重复发送不再重新编码；
+      重新编码反而更大的图片只记录一个空标记文件，之后直接沿用原图
+    - 统计编码前后的 Base64 载荷大小，便于确认节省效果
+    """
+
+    def __init__(self, max_edge=1280, fmt="JPEG", quality=85, cache_dir=".payload_cache"):
+        self.max_edge = max_edge
+        self.fmt = fmt.upper()
+        self.quality = quality
+        self.cache_dir = cache_dir
+        self.stats = {"images": 0, "original_bytes": 0, "encoded_bytes": 0, "cache_hits": 0}
+
+    def _key(self, raw):
+        digest = hashlib.sha256(raw).hexdigest()
+        return f"{digest}_{self.max_edge}_{self.fmt.lower()}_{self.quality}"
+
+    def _shrink(self, raw):
+        img = Image.open(BytesIO(raw))
+        img.thumbnail((self.max_edge, self.max_edge), Image.LANCZOS)
+        if self.fmt == "JPEG" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        out = BytesIO()
+        img.save(out, self.fmt, quality=self.quality, optimize=True)
+        data = out.getvalue()
+        # 已经足够小的原图重新编码后可能反而变大，此时直接使用原图
+        return (data, MIME[self.fmt]) if len(data) < len(raw) else (raw, None)
+
+    def encode_bytes(self, raw):
+        """返回 (编码后字节, MIME 类型)；MIME 为 None 表示沿用原图"""
+        path = os.path.join(self.cache_dir, self._key(raw)) if self.cache_dir else None
+        if path and os.path.exists(path):
+            self.stats["cache_hits"] += 1
+            with open(path, "rb") as f:
+                return f.read(), MIME[self.fmt]
+        if path and os.path.exists(f"{path}.orig"):
+            self.stats["cache_hits"] += 1
+            return raw, None
+
+        data, mime = self._shrink(raw)
+        if path:
+            os.makedirs(self.cache_dir, exist_ok=True)  # 首次写入时才创建缓存目录
+            target = path if mime else f"{path}.orig"
+            # 临时文件名按线程区分，多个线程同时编码同一张图时互不覆盖
+            part = f"{target}.{threading.get_ident()}.part"
+            with open(part, "wb") as f:
+                f.write(data if mime else b"")
+            os.replace(part, target)
+        return data, mime
+
+    def encode(self, image_path):
+        """将本地图片编码为 data URL，失败返回 None"""
+        try:
+            with open(image_path, "rb") as f:
+                raw = f.read()
+            data, mime = self.encode_bytes(raw)
+        except Exception as e:
+            print(f"[Warning] 图像编码失败: {image_path} | {e}")
+            return None
+        if mime is None:
+            mime = Image.MIME.get(Image.open(BytesIO(raw)).format, "image/jpeg")
+        b64 = base64.b64encode(data).decode("utf-8")
+        self.stats["images"] += 1
+        self.stats["original_bytes"] += (len(raw) + 2) // 3 * 4
+        self.stats["encoded_bytes"] += len(b64)
+        return f"data:{mime};base64,{b64}"
+
+    def reset_stats(self):
+        self.stats = dict.fromkeys(self.stats, 0)
+
+    def report(self):
+        before, after = self.stats["original_bytes"], self.stats["encoded_bytes"]
+        ratio = (1 - after / before) * 100 if before else 0
+        return (f"[Payload] {self.stats['images']} 帧 | 编码前 {before / 1024:.0f} KB -> 编码后 {after / 1024:.0f} KB "
+                f"(节省 {ratio:.1f}%) | 缓存命中 {self.stats['cache_hits']} 次")
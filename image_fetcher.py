@@ -0,0 +1,130 @@
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import requests
+from PIL import Image, ImageFile
+
+# 小红书 CDN 需要带上 Referer，否则会返回 403
+HEADERS = {'User-Agent': 'Mozilla/5.0', 'Referer': 'https://www.xiaohongshu.com/'}
+
+
+class ImageFetcher:
+    """
+    单次运行内共享的图片获取层：
+    - 同一 URL 只从 CDN 完整拉取一次，分辨率检测与落盘下载共用同一份字节
+    - 分辨率检测只读取图片头部，被拒绝的笔记不会下载完整文件
+    - 头部读取后若需要完整文件，使用 Range 请求续传剩余部分
+    """
+
+    def __init__(self, max_cache_bytes=64 * 1024 * 1024, chunk_size=16 * 1024):
+        self.session = requests.Session()
+        self.session.headers.update(HEADERS)
+        self.max_cache_bytes = max_cache_bytes
+        self.chunk_size = chunk_size
+        self._full = OrderedDict()   # url -> 完整字节 (按 LRU 淘汰)
+        self._heads = {}             # url -> 已读取的头部字节
+        self._sizes = {}             # url -> (宽, 高)
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "bytes": 0, "hits": 0}
+
+    # --- 缓存管理 ---
+    def _remember(self, url, data):
+        with self._lock:
+            if url in self._full:
+                return
+            self._full[url] = data
+            self._cached_bytes += len(data)
+            self._heads.pop(url, None)
+            while self._cached_bytes > self.max_cache_bytes and len(self._full) > 1:
+                _, old = self._full.popitem(last=False)
+                self._cached_bytes -= len(old)
+
+    def _cached(self, url):
+        with self._lock:
+            data = self._full.get(url)
+            if data is not None:
+                self._full.move_to_end(url)
+                self.stats["hits"] += 1
+            return data
+
+    def forget(self, urls):
+        """释放指定 URL 的缓存（一条笔记处理完后调用）"""
+        with self._lock:
+            for url in urls:
+                data = self._full.pop(url, None)
+                if data is not None:
+                    self._cached_bytes -= len(data)
+                self._heads.pop(url, None)
+
+    def close(self):
+        self.session.close()
+
+    # --- 对外接口 ---
+    def probe_size(self, url, timeout=5):
+        """只读取图片头部解析宽高，失败返回 None"""
+        if url in self._sizes:
+            return self._sizes[url]
+        data = self._cached(url)
+        if data is not None:
+            size = Image.open(BytesIO(data)).size
+            self._sizes[url] = size
+            return size
+
+        parser = ImageFile.Parser()
+        head = bytearray()
+        with self.session.get(url, timeout=timeout, stream=True) as res:
+            self.stats["requests"] += 1
+            if res.status_code != 200:
+                return None
+            for chunk in res.iter_content(self.chunk_size):
+                head.extend(chunk)
+                self.stats["bytes"] += len(chunk)
+                parser.feed(chunk)
+                if parser.image is not None:
+                    break
+            else:
+                # 整个文件都读完了，直接作为完整缓存
+                self._remember(url, bytes(head))
+        if parser.image is None:
+            return None
+        size = parser.image.size
+        self._sizes[url] = size
+        if url not in self._full:
+            self._heads[url] = bytes(head)
+        return size
+
+    def iter_content(self, url, timeout=10):
+        """
+        按块流式读取图片，不在内存中保留完整文件
+        已缓存则一次性返回缓存；已读过头部则先返回头部再续传剩余部分
+        """
+        data = self._cached(url)
+        if data is not None:
+            yield data
+            return
+
+        head = self._heads.pop(url, b"")
+        extra = {'Range': f'bytes={len(head)}-'} if head else {}
+        with self.session.get(url, headers=extra, timeout=timeout, stream=True) as res:
+            self.stats["requests"] += 1
+            if res.status_code == 206:
+                yield head
+            elif res.status_code != 200:
+                raise IOError(f"HTTP {res.status_code}: {url}")
+            for chunk in res.iter_content(self.chunk_size):
+                self.stats["bytes"] += len(chunk)
+                yield chunk
+
+    def fetch(self, url, timeout=10):
+        """获取完整图片字节，已缓存则直接返回，失败返回 None"""
+        data = self._cached(url)
+        if data is not None:
+            return data
+        try:
+            data = b"".join(self.iter_content(url, timeout=timeout))
+        except IOError:
+            return None
+        self._remember(url, data)
+        return data
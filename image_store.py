@@ -0,0 +1,86 @@
+import os
+import hashlib
+import shutil
+import tempfile
+from PIL import Image
+
+BLOB_DIR = ".blobs"
+
+
+class ImageStore:
+    """
+    按内容哈希寻址的图片仓库：
+    - 图片按块流式写入临时文件，边写边计算 sha256，内存占用与图片大小无关
+    - 写入完成后校验图片能否完整解码，截断/损坏的文件直接丢弃
+    - 通过 os.replace 原子落盘，同一内容只保存一份
+    - note_N/i.jpg 以硬链接引用仓库中的文件（不支持硬链接时退化为复制）
+    """
+
+    def __init__(self, root):
+        self.root = os.path.join(root, BLOB_DIR)
+        os.makedirs(self.root, exist_ok=True)
+        self.stats = {"stored": 0, "deduped": 0, "rejected": 0, "bytes": 0}
+
+    def blob_path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    @staticmethod
+    def _verify(path):
+        """完整解码一次图片，截断或格式错误会抛出异常"""
+        try:
+            with Image.open(path) as img:
+                img.load()
+            return True
+        except Exception:
+            return False
+
+    def put_stream(self, chunks):
+        """将数据块写入仓库，返回内容哈希；数据无效时返回 None"""
+        sha = hashlib.sha256()
+        size = 0
+        fd, tmp = tempfile.mkstemp(dir=self.root, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    if not chunk:
+                        continue
+                    sha.update(chunk)
+                    f.write(chunk)
+                    size += len(chunk)
+
+            if size == 0 or not self._verify(tmp):
+                self.stats["rejected"] += 1
+                return None
+
+            digest = sha.hexdigest()
+            dst = self.blob_path(digest)
+            if os.path.exists(dst):
+                self.stats["deduped"] += 1
+            else:
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                os.replace(tmp, dst)
+                self.stats["stored"] += 1
+                self.stats["bytes"] += size
+            return digest
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def link(self, digest, dst):
+        """在目标位置原子地创建对仓库文件的引用"""
+        src = self.blob_path(digest)
+        tmp = f"{dst}.part"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(src, tmp)
+        except OSError:
+            shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+
+    def save(self, chunks, dst):
+        """流式写入并链接到 dst，成功返回内容哈希"""
+        digest = self.put_stream(chunks)
+        if digest:
+            self.link(digest, dst)
+        return digest
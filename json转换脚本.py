@@ -1,6 +1,14 @@
 import csv
 import json
 import os
+import re
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+from shard_dataset import export_shards
+
+IMAGE_RE = re.compile(r'(\d+)\.jpg')
 
 def convert_csv_to_json(csv_path, base_image_dir, output_json):
     """
@@ -53,10 +61,180 @@ def convert_csv_to_json(csv_path, base_image_dir, output_json):
     except Exception as e:
         print(f"处理过程中出现异常: {e}")
 
+def file_sha256(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def scan_note(task):
+    """
+    扫描单个 note 文件夹 (可在子进程中执行)
+    task 为 (note 文件夹路径, CSV 行, 上次的清单条目)
+    返回 (清单条目, 图片记录列表)；与上次相比没有变化时记录列表为 None
+    """
+    folder, row, prev = task
+    count = int(row['图片数量'])
+    # 一次 scandir 拿到文件名、修改时间与大小，不再逐张 os.path.exists
+    files = {}
+    with os.scandir(folder) as it:
+        for entry in it:
+            m = IMAGE_RE.fullmatch(entry.name)
+            if m and 1 <= int(m.group(1)) <= count and entry.is_file():
+                st = entry.stat()
+                files[entry.name] = [st.st_mtime_ns, st.st_size]
+    meta = [row['标题'], row['正文'], row['链接']]
+    fingerprint = hashlib.sha256(json.dumps([meta, sorted(files.items())], ensure_ascii=False).encode('utf-8')).hexdigest()
+    if prev and prev.get('fingerprint') == fingerprint:
+        return prev, None
+
+    # 只对修改时间或大小变化的图片重新计算内容哈希
+    prev_files = (prev or {}).get('files', {})
+    records = []
+    folder_name = os.path.basename(folder)
+    for name in sorted(files, key=lambda n: int(IMAGE_RE.fullmatch(n).group(1))):
+        old = prev_files.get(name)
+        sha = old[2] if old and old[:2] == files[name] else file_sha256(os.path.join(folder, name))
+        files[name].append(sha)
+        records.append({
+            "key": f"{folder_name}_{name}",
+            "note": folder_name,
+            "relative_path": os.path.join(folder, name),
+            "title": row['标题'],
+            "text_annotation": row['正文'],  # 文本标注
+            "original_note_url": row['链接'],
+            "sha256": sha,
+        })
+    return {"fingerprint": fingerprint, "files": files}, records
+
+
+def _note_ranges(path):
+    """扫描已有 JSONL，返回 {note: [(起始偏移, 结束偏移), ...]}，同一 note 的相邻行合并为一个区间"""
+    ranges, pos = {}, 0
+    with open(path, 'rb') as f:
+        for line in f:
+            note = json.loads(line)['note']
+            spans = ranges.setdefault(note, [])
+            if spans and spans[-1][1] == pos:
+                spans[-1] = (spans[-1][0], pos + len(line))
+            else:
+                spans.append((pos, pos + len(line)))
+            pos += len(line)
+    return ranges
+
+
+def export_jsonl(csv_path, base_image_dir, output_jsonl, manifest_path=None, workers=0, full=False):
+    """
+    流式导出 JSONL 标注 (每行一张图片)，配合清单文件增量更新：
+    - 清单记录每个 note 的图片修改时间、大小与内容哈希，重新运行时只重新生成有变化的 note
+    - 输出按 CSV 顺序逐个 note 写出：变化的 note 边扫描边写入，未变化的 note 从上一次的输出按字节区间拷贝，不整体载入内存
+    - workers > 0 时用进程池并行扫描与计算哈希
+    """
+    if not os.path.exists(csv_path):
+        print(f"错误: 找不到文件 {csv_path}")
+        return
+    manifest_path = manifest_path or output_jsonl + '.manifest.json'
+    manifest = {}
+    if not full and os.path.exists(manifest_path) and os.path.exists(output_jsonl):
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+
+    # 根目录只列一次，CSV 中有记录但文件夹不存在的 note 直接跳过
+    with os.scandir(base_image_dir) as it:
+        note_dirs = {e.name for e in it if e.name.startswith('note_') and e.is_dir()}
+    tasks = []
+    with open(csv_path, 'r', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f):
+            folder_name = f"note_{row['序号']}"
+            if folder_name in note_dirs:
+                tasks.append((os.path.join(base_image_dir, folder_name), row, manifest.get(folder_name)))
+
+    if workers > 0:
+        pool = ProcessPoolExecutor(max_workers=workers)
+        results = pool.map(scan_note, tasks, chunksize=32)
+    else:
+        pool, results = None, map(scan_note, tasks)
+
+    # 上一次输出中每个 note 的字节区间，只保存偏移，不载入记录内容
+    old_ranges = _note_ranges(output_jsonl) if manifest else {}
+    new_manifest, changed, emitted, kept = {}, set(), 0, 0
+    tmp_path = output_jsonl + '.tmp'
+    try:
+        # 按 CSV 顺序逐条写出：变化的 note 写入新生成的记录，未变化的 note 从上次输出按字节区间拷贝
+        with open(tmp_path, 'wb') as out, open(output_jsonl if old_ranges else os.devnull, 'rb') as old:
+            for (folder, row, _), (entry, records) in zip(tasks, results):
+                folder_name = os.path.basename(folder)
+                if records is None and folder_name in old_ranges:
+                    new_manifest[folder_name] = entry
+                    for start, end in old_ranges[folder_name]:
+                        old.seek(start)
+                        out.write(old.read(end - start))
+                    kept += len(entry['files'])
+                    continue
+                if records is None:  # 清单中有记录但上次输出里缺失，重新扫描
+                    entry, records = scan_note((folder, row, None))
+                new_manifest[folder_name] = entry
+                changed.add(folder_name)
+                for rec in records:
+                    out.write((json.dumps(rec, ensure_ascii=False) + '\n').encode('utf-8'))
+                    emitted += 1
+        os.replace(tmp_path, output_jsonl)
+    finally:
+        if pool:
+            pool.shutdown()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    with open(manifest_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(new_manifest, f, ensure_ascii=False)
+    os.replace(manifest_path + '.tmp', manifest_path)
+
+    removed = len(set(manifest) - set(new_manifest))
+    print(f"导出完成！变化 {len(changed)} 条笔记 (新生成 {emitted} 张图片标注)，沿用 {kept} 张，移除 {removed} 条笔记。")
+    print(f"结果已保存至: {output_jsonl}")
+
+def export_dataset(csv_path, base_image_dir, out_dir, shard_mb=256):
+    """
+    打包为分片数据集 (分片二进制 + 偏移索引)，训练时通过 shard_dataset.ShardReader 以 mmap 随机读取
+    每条记录的标注与 JSONL 导出一致
+    """
+    if not os.path.exists(csv_path):
+        print(f"错误: 找不到文件 {csv_path}")
+        return
+    with os.scandir(base_image_dir) as it:
+        note_dirs = {e.name for e in it if e.name.startswith('note_') and e.is_dir()}
+
+    def records():
+        with open(csv_path, 'r', encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                folder_name = f"note_{row['序号']}"
+                if folder_name not in note_dirs:
+                    continue
+                _, recs = scan_note((os.path.join(base_image_dir, folder_name), row, None))
+                for rec in recs:
+                    yield rec, rec['relative_path']
+
+    manifest = export_shards(records(), out_dir, shard_mb)
+    print(f"打包完成！共 {manifest['count']} 张图片，{len(manifest['shards'])} 个分片。")
+    print(f"结果已保存至: {out_dir}")
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="采集数据导出为标注文件")
+    parser.add_argument("--format", choices=["jsonl", "json", "shards"], default="jsonl",
+                        help="jsonl 为流式增量导出，json 为旧版整体导出，shards 为训练用分片数据集")
+    parser.add_argument("--shard-mb", type=float, default=256, help="shards 模式下单个分片的大小上限 (MB)")
+    parser.add_argument("--workers", type=int, default=0, help="并行扫描的进程数，0 表示不使用进程池")
+    parser.add_argument("--full", action="store_true", help="忽略清单，全部重新导出")
+    args = parser.parse_args()
+
     # 配置路径
     CSV_FILE = os.path.join('RedComic_Final_Fixed', 'metadata.csv')
     IMAGE_DIR = 'RedComic_Final_Fixed'
-    OUTPUT_FILE = 'annotations.json'
 
-    convert_csv_to_json(CSV_FILE, IMAGE_DIR, OUTPUT_FILE)
\ No newline at end of file
+    if args.format == "json":
+        convert_csv_to_json(CSV_FILE, IMAGE_DIR, 'annotations.json')
+    elif args.format == "shards":
+        export_dataset(CSV_FILE, IMAGE_DIR, 'dataset_shards', args.shard_mb)
+    else:
+        export_jsonl(CSV_FILE, IMAGE_DIR, 'annotations.jsonl', workers=args.workers, full=args.full)
@@ -1,11 +1,13 @@
 import pygame
-import threading
 import sys
+import time
+from collections import OrderedDict
 import json
 import os
-import importlib
 import pyperclip
 from dotenv import load_dotenv
+from task_worker import TaskWorker
+from tracer import TraceMonitor
 
 # 1. 初始化与环境配置
 load_dotenv() # 加载根目录 .env 中的 API Key
@@ -34,6 +36,31 @@ font_main = load_system_font(22)
 font_log = load_system_font(16)
 font_label = load_system_font(14)
 
+# 帧率：有变化时保持流畅，空闲时降到低帧率，只轮询事件与任务进程
+ACTIVE_FPS = 60
+IDLE_FPS = 8
+IDLE_AFTER = 0.5   # 距上次重绘超过该秒数视为空闲
+TRACE_POLL = 1.0   # 吞吐面板读取追踪文件的间隔 (秒)
+REDRAW_EVENTS = {pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED, pygame.WINDOWSHOWN}
+
+class TextCache:
+    """文字渲染缓存：相同的 (字体, 文本, 颜色) 只调用一次 font.render"""
+    def __init__(self, max_items=512):
+        self.max_items = max_items
+        self._items = OrderedDict()
+    def render(self, font, text, color):
+        key = (id(font), text, color)
+        surf = self._items.get(key)
+        if surf is None:
+            surf = self._items[key] = font.render(text, True, color)
+            if len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        else:
+            self._items.move_to_end(key)
+        return surf
+
+text_cache = TextCache()
+
 CONFIG_FILE = "app_config.json"
 
 def load_config():
@@ -61,8 +88,12 @@ class InputField:
         pygame.draw.rect(surf, INPUT_BG, self.rect, border_radius=6)
         color = ACCENT_COLOR if self.active else (80, 100, 120)
         pygame.draw.rect(surf, color, self.rect, 2, border_radius=6)
-        surf.blit(font_label.render(self.label, True, (160, 180, 200)), (self.rect.x, self.rect.y - 20))
-        surf.blit(font_log.render(self.text, True, (240, 240, 240)), (self.rect.x + 10, self.rect.y + 11))
+        surf.blit(text_cache.render(font_label, self.label, (160, 180, 200)), (self.rect.x, self.rect.y - 20))
+        surf.blit(text_cache.render(font_log, self.text, (240, 240, 240)), (self.rect.x + 10, self.rect.y + 11))
+    @property
+    def area(self):
+        """包含上方标签的重绘区域"""
+        return pygame.Rect(self.rect.x, self.rect.y - 20, self.rect.w, self.rect.h + 20)
 
 class Button:
     def __init__(self, x, y, w, h, text, action_id):
@@ -72,7 +103,7 @@ class Button:
         bg = (35, 55, 75) if hover else PANEL_COLOR
         pygame.draw.rect(surf, bg, self.rect, border_radius=8)
         pygame.draw.rect(surf, ACCENT_COLOR, self.rect, 2, border_radius=8)
-        t_surf = font_main.render(self.text, True, TEXT_COLOR)
+        t_surf = text_cache.render(font_main, self.text, TEXT_COLOR)
         surf.blit(t_surf, (self.rect.centerx - t_surf.get_width()//2, self.rect.centery - t_surf.get_height()//2))
 
 # 4. 业务逻辑控制
@@ -85,44 +116,102 @@ inputs = [
 use_filter = config.get("use_qwen_filter", False)
 filter_rect = pygame.Rect(800, 380, 250, 50)
 logs = ["系统初始化完成", "API Key 已准备就绪"]
+log_version = 0   # 日志变化计数，用于判断日志区是否需要重绘
 is_running = False
+progress_text = ""
+# 常驻任务进程：业务脚本不再在界面进程中 reload 执行
+worker = TaskWorker()
+# 吞吐面板：读取任务进程写入的追踪文件，统计最近 5 分钟各阶段的次/分与耗时分位数
+trace_monitor = TraceMonitor()
+trace_rows = []
 
 def add_log(msg):
+    global log_version
+    log_version += 1
     logs.append(f"> {msg}")
     if len(logs) > 20: logs.pop(0)
 
 def run_task(action_id, btn_text):
-    """在子线程中运行业务脚本"""
-    global is_running
-    is_running = True
-    add_log(f"任务启动: {btn_text}")
-    try:
-        if action_id == "1":
-            import spider
-            importlib.reload(spider)
-            spider.main()
-        elif action_id == "2":
-            import rewrite_images
-            importlib.reload(rewrite_images); rewrite_images.main()
-        elif action_id == "3":
-            import auto_publish_batch
-            importlib.reload(auto_publish_batch); auto_publish_batch.start()
-        elif action_id == "4":
-            import fetch_interaction_stats
-            importlib.reload(fetch_interaction_stats); fetch_interaction_stats.get_stats()
-        elif action_id == "5":
-            import visualize_stats
-            importlib.reload(visualize_stats); visualize_stats.generate_report()
-        add_log("任务正常结束")
-    except Exception as e:
-        add_log(f"错误: {str(e)[:50]}...")
-    finally:
-        is_running = False
-
-# 5. 主循环
+    """把任务交给常驻任务进程执行"""
+    global is_running, progress_text
+    if worker.submit(action_id):
+        is_running = True
+        progress_text = ""
+        add_log(f"任务启动: {btn_text}")
+    else:
+        add_log("任务进程忙碌或不可用")
+
+def handle_worker_events():
+    """处理任务进程回传的日志、进度与状态"""
+    global is_running, progress_text
+    for event in worker.poll():
+        kind = event[0]
+        if kind == "log":
+            add_log(event[1][:60])
+        elif kind == "progress":
+            _, done, total, label = event
+            progress_text = f"{label} {done}/{total}" if total else f"{label} {done}"
+        elif kind == "done":
+            _, action_id, ok, elapsed, err = event
+            add_log(f"任务正常结束 ({elapsed:.0f}s)" if ok else f"错误: {err[:50]}...")
+            is_running = False
+        elif kind == "exit":
+            if is_running:
+                add_log("任务进程意外退出，下次启动任务时自动重启")
+            is_running = False
+
+# 5. 分区绘制：每个区域先铺背景再绘制内容，只在内容变化时重绘
+LOG_RECT = pygame.Rect(360, 100, 410, 560)
+STATUS_RECT = pygame.Rect(30, 695, 320, 30)
+TRACE_RECT = pygame.Rect(790, 450, 290, 240)
+TRACE_COLS = [(0, "阶段"), (95, "次/分"), (140, "p50"), (190, "p95"), (240, "失败")]
+
+def draw_header(surf):
+    surf.fill(BG_COLOR)
+    pygame.draw.line(surf, ACCENT_COLOR, (0, 65), (WIDTH, 65), 2)
+    surf.blit(text_cache.render(font_main, "XHS 自动化全链路控制台 v3.3", ACCENT_COLOR), (20, 20))
+
+def draw_filter(surf):
+    f_color = ACCENT_COLOR if use_filter else (120, 120, 120)
+    pygame.draw.rect(surf, INPUT_BG, filter_rect, border_radius=6)
+    pygame.draw.rect(surf, f_color, filter_rect, 2, border_radius=6)
+    f_txt = "Qwen 视觉过滤: 开启" if use_filter else "Qwen 视觉过滤: 关闭"
+    surf.blit(text_cache.render(font_log, f_txt, f_color), (filter_rect.x + 15, filter_rect.y + 15))
+
+def draw_logs(surf):
+    pygame.draw.rect(surf, PANEL_COLOR, LOG_RECT, border_radius=10)
+    for i, line in enumerate(logs):
+        surf.blit(text_cache.render(font_log, line, (180, 190, 200)), (375, 115 + i*26))
+
+def draw_trace(surf):
+    pygame.draw.rect(surf, PANEL_COLOR, TRACE_RECT, border_radius=10)
+    x, y = TRACE_RECT.x + 12, TRACE_RECT.y + 10
+    for dx, title in TRACE_COLS:
+        surf.blit(text_cache.render(font_label, title, (160, 180, 200)), (x + dx, y))
+    if not trace_rows:
+        surf.blit(text_cache.render(font_label, "暂无追踪数据", (120, 130, 140)), (x, y + 26))
+    for i, row in enumerate(trace_rows[:10]):
+        for (dx, _), cell in zip(TRACE_COLS, row):
+            surf.blit(text_cache.render(font_label, cell, TEXT_COLOR), (x + dx, y + 26 + i * 20))
+
+def update_trace():
+    """读取新增的追踪记录，格式化为面板行 (阶段, 次/分, p50, p95, 失败次数)"""
+    global trace_rows
+    trace_rows = [(stage[:12], f"{rate:.1f}", f"{p50:.2f}s", f"{p95:.2f}s", str(failed))
+                  for stage, rate, p50, p95, failed in trace_monitor.poll()]
+
+def draw_status(surf):
+    pygame.draw.circle(surf, (220, 60, 60) if is_running else (60, 220, 100), (45, 710), 8)
+    if progress_text:
+        surf.blit(text_cache.render(font_label, progress_text, TEXT_COLOR), (65, 701))
+
+# 6. 主循环
 def main():
-    global use_filter, is_running
+    global use_filter
     clock = pygame.time.Clock()
+    worker.start()
+    last_sigs, first_frame, last_active = {}, True, time.time()
+    last_trace = 0
     
     # 定义左侧 5 个功能按钮
     btn_list = [
@@ -135,8 +224,13 @@ def main():
 
     while True:
         mx, my = pygame.mouse.get_pos()
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT: pygame.quit(); sys.exit()
+        events = pygame.event.get()
+        had_events = bool(events)
+        for event in events:
+            if event.type == pygame.QUIT: worker.close(); pygame.quit(); sys.exit()
+            # 窗口被遮挡 / 最小化后恢复时，部分平台不保留窗口内容，整屏重绘一次
+            if event.type in REDRAW_EVENTS:
+                first_frame = True
             
             # 输入框处理
             for inp in inputs:
@@ -159,38 +253,42 @@ def main():
                         current_cfg = {i.key: i.text for i in inputs}
                         current_cfg["use_qwen_filter"] = use_filter
                         save_config(current_cfg)
-                        # 启动线程
-                        threading.Thread(target=run_task, args=(btn.action_id, btn.text), daemon=True).start()
-
-        # --- 渲染逻辑 ---
-        screen.fill(BG_COLOR)
-        pygame.draw.line(screen, ACCENT_COLOR, (0, 65), (WIDTH, 65), 2)
-        screen.blit(font_main.render("XHS 自动化全链路控制台 v3.3", True, ACCENT_COLOR), (20, 20))
-
-        # 绘制按钮
-        for btn in btn_list:
-            btn.draw(screen, btn.rect.collidepoint(mx, my))
-        
-        # 绘制输入框
-        for inp in inputs: inp.draw(screen)
-
-        # 绘制视觉过滤开关
-        f_color = ACCENT_COLOR if use_filter else (120, 120, 120)
-        pygame.draw.rect(screen, INPUT_BG, filter_rect, border_radius=6)
-        pygame.draw.rect(screen, f_color, filter_rect, 2, border_radius=6)
-        f_txt = "Qwen 视觉过滤: 开启" if use_filter else "Qwen 视觉过滤: 关闭"
-        screen.blit(font_log.render(f_txt, True, f_color), (filter_rect.x + 15, filter_rect.y + 15))
-
-        # 绘制日志区
-        pygame.draw.rect(screen, PANEL_COLOR, (360, 100, 410, 560), border_radius=10)
-        for i, line in enumerate(logs):
-            screen.blit(font_log.render(line, True, (180, 190, 200)), (375, 115 + i*26))
-
-        # 状态灯
-        pygame.draw.circle(screen, (220, 60, 60) if is_running else (60, 220, 100), (45, 710), 8)
-        
-        pygame.display.flip()
-        clock.tick(60)
+                        run_task(btn.action_id, btn.text)
+
+        handle_worker_events()
+        if time.time() - last_trace >= TRACE_POLL:
+            last_trace = time.time()
+            update_trace()
+
+        # --- 渲染逻辑：只重绘状态发生变化的区域 ---
+        regions = [(btn.rect, btn.rect.collidepoint(mx, my), lambda s, b=btn: b.draw(s, b.rect.collidepoint(mx, my)))
+                   for btn in btn_list]
+        regions += [(inp.area, (inp.text, inp.active), inp.draw) for inp in inputs]
+        regions += [
+            (filter_rect, use_filter, draw_filter),
+            (LOG_RECT, log_version, draw_logs),
+            (STATUS_RECT, (is_running, progress_text), draw_status),
+            (TRACE_RECT, tuple(trace_rows), draw_trace),
+        ]
+        dirty = []
+        if first_frame:
+            draw_header(screen)
+        for i, (rect, sig, draw) in enumerate(regions):
+            if first_frame or last_sigs.get(i) != sig:
+                last_sigs[i] = sig
+                screen.fill(BG_COLOR, rect)
+                draw(screen)
+                dirty.append(rect)
+
+        if first_frame:
+            pygame.display.flip()
+            first_frame = False
+        elif dirty:
+            pygame.display.update(dirty)
+        now = time.time()
+        if dirty or had_events:
+            last_active = now
+        clock.tick(ACTIVE_FPS if now - last_active < IDLE_AFTER else IDLE_FPS)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,232 @@
+import os
+import time
+import json
+import random
+import hashlib
+import argparse
+import threading
+from urllib.parse import urlparse
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# 模拟六格识别与故事改写的固定回复
+STORY_TEXT = "午后的约定\n\n小猫在窗台上等了一整个下午，终于等到主人推门回家。它假装生气扭过头去，却在闻到小鱼干的香味时忍不住回头。主人笑着把它抱进怀里，说明天一定早点回来。小猫眯起眼睛，把这句话当成了约定。\n\n猫咪, 日常, 治愈, 漫画, 宠物"
+BAD_STORY_TEXT = "**午后的约定**\n\n# 正文\n- 小猫在窗台上等待\n"
+
+
+class MockConfig:
+    """模拟服务参数，运行中可直接修改"""
+
+    def __init__(self, latency=0.5, jitter=0.1, error_rate=0.0, rps=0.0, burst=5,
+                 yes_rate=0.5, bad_format_rate=0.0, chunk_delay=0.01, image_dir=None, packed_bad_rate=0.0):
+        self.latency = latency              # 平均响应延迟 (秒)
+        self.jitter = jitter                # 延迟随机抖动 (秒)
+        self.error_rate = error_rate        # 返回 500 的概率
+        self.rps = rps                      # 每秒请求上限，0 表示不限流
+        self.burst = burst                  # 限流令牌桶容量
+        self.yes_rate = yes_rate            # 六格识别回答「是」的比例
+        self.bad_format_rate = bad_format_rate  # 故事改写输出违规格式的概率
+        self.chunk_delay = chunk_delay      # 流式输出每块的间隔
+        self.image_dir = image_dir          # /images/ 下提供的本地图片目录
+        self.packed_bad_rate = packed_bad_rate  # 多图识别回复缺少某个编号的概率
+
+
+class MockState:
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.Lock()
+        self.tokens = float(config.burst)
+        self.refilled = time.time()
+        self.stats = {"requests": 0, "bytes_in": 0, "errors": 0, "rate_limited": 0,
+                      "in_flight": 0, "max_in_flight": 0}
+
+    def take_token(self):
+        """令牌桶限流，返回是否放行"""
+        if not self.config.rps:
+            return True
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.config.burst, self.tokens + (now - self.refilled) * self.config.rps)
+            self.refilled = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state = None  # 由 start_server 绑定
+
+    def log_message(self, *args):
+        pass
+
+    def _send_json(self, code, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _local_image(self, path):
+        """/images/ 下的请求路径映射到本地文件，不存在或越界时返回 None"""
+        cfg = self.state.config
+        if not (path.startswith("/images/") and cfg.image_dir):
+            return None
+        local = os.path.normpath(os.path.join(cfg.image_dir, path[len("/images/"):].split("?")[0]))
+        if local.startswith(os.path.normpath(cfg.image_dir)) and os.path.isfile(local):
+            return local
+        return None
+
+    def do_GET(self):
+        # 提供合成图片，供 spider 的图片获取层下载
+        path = self._local_image(self.path)
+        if path:
+            with open(path, "rb") as f:
+                data = f.read()
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        st, cfg = self.state, self.state.config
+        length = int(self.headers.get("Content-Length", 0))
+        raw = self.rfile.read(length)
+        with st.lock:
+            st.stats["requests"] += 1
+            st.stats["bytes_in"] += length
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        if not st.take_token():
+            with st.lock:
+                st.stats["rate_limited"] += 1
+            self._send_json(429, {"error": {"message": "Requests rate limit exceeded", "type": "rate_limit_error",
+                                            "code": "rate_limit_exceeded"}}, {"Retry-After": "1"})
+            return
+
+        with st.lock:
+            st.stats["in_flight"] += 1
+            st.stats["max_in_flight"] = max(st.stats["max_in_flight"], st.stats["in_flight"])
+        try:
+            time.sleep(max(0.0, cfg.latency + random.uniform(-cfg.jitter, cfg.jitter)))
+            if random.random() < cfg.error_rate:
+                with st.lock:
+                    st.stats["errors"] += 1
+                self._send_json(500, {"error": {"message": "mock internal error", "type": "server_error"}})
+                return
+            req = json.loads(raw or b"{}")
+            text = self._reply_text(req)
+            if req.get("stream"):
+                self._stream(req, text)
+            else:
+                self._send_json(200, {
+                    "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()),
+                    "model": req.get("model", "mock"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                    "usage": {"prompt_tokens": length // 4, "completion_tokens": len(text), "total_tokens": length // 4 + len(text)},
+                })
+        finally:
+            with st.lock:
+                st.stats["in_flight"] -= 1
+
+    def _reply_text(self, req):
+        cfg = self.state.config
+        parts = [p for m in req.get("messages", []) for p in (m.get("content") if isinstance(m.get("content"), list) else [])]
+        prompt = "".join(p.get("text", "") for p in parts if p.get("type") == "text")
+        images = [p["image_url"]["url"] for p in parts if p.get("type") == "image_url"]
+        if "六格漫画" in prompt:
+            answers = ["是" if self._verdict(url) else "否" for url in images]
+            if len(answers) == 1:
+                return answers[0]
+            lines = [f"{i + 1}: {a}" for i, a in enumerate(answers)]
+            if random.random() < cfg.packed_bad_rate:
+                # 模拟模型漏答一张
+                lines.pop(random.randrange(len(lines)))
+            return "\n".join(lines)
+        return BAD_STORY_TEXT if random.random() < cfg.bad_format_rate else STORY_TEXT
+
+    def _verdict(self, url):
+        """
+        本地图片用版式检测给出结论，近似真实模型；其余按图片地址哈希确定性地给出结论
+        同一张图多次识别结果一致
+        """
+        path = self._local_image(urlparse(url).path) if url.startswith("http") else None
+        if path:
+            from panel_detector import detect_panels
+            with open(path, "rb") as f:
+                res = detect_panels(f.read())
+            return res["verdict"]
+        h = int(hashlib.md5(url[:256].encode("utf-8")).hexdigest(), 16) % 1000
+        return h < self.state.config.yes_rate * 1000
+
+    def _stream(self, req, text):
+        cfg = self.state.config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            for i in range(0, len(text), 8):
+                chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": req.get("model", "mock"),
+                         "choices": [{"index": 0, "delta": {"content": text[i:i + 8]}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(cfg.chunk_delay)
+            self.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端中止了流式请求
+            pass
+
+
+def start_server(config=None, host="127.0.0.1", port=0):
+    """
+    在后台线程启动模拟服务，返回 (server, state, base_url)
+    将 DASHSCOPE_BASE_URL 设置为 base_url 即可让 spider / rewrite_images 改用本地服务
+    """
+    state = MockState(config or MockConfig())
+    handler = type("BoundMockHandler", (MockHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, state, f"http://{host}:{server.server_address[1]}/v1"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 OpenAI 兼容 DashScope 模拟服务")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.5, help="平均响应延迟 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="延迟抖动 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率")
+    parser.add_argument("--rps", type=float, default=0.0, help="每秒请求上限，0 表示不限流")
+    parser.add_argument("--burst", type=int, default=5, help="限流令牌桶容量")
+    parser.add_argument("--bad-format-rate", type=float, default=0.0, help="故事改写输出违规格式的概率")
+    parser.add_argument("--image-dir", default=None, help="通过 /images/ 提供的本地图片目录")
+    parser.add_argument("--packed-bad-rate", type=float, default=0.0, help="多图识别回复漏答一张的概率")
+    args = parser.parse_args()
+
+    cfg = MockConfig(args.latency, args.jitter, args.error_rate, args.rps, args.burst,
+                     bad_format_rate=args.bad_format_rate, image_dir=args.image_dir,
+                     packed_bad_rate=args.packed_bad_rate)
+    server, state, base_url = start_server(cfg, port=args.port)
+    print(f"模拟服务已启动: {base_url}")
+    print(f"使用方式: DASHSCOPE_BASE_URL={base_url} python spider.py")
+    try:
+        while True:
+            time.sleep(10)
+            print(f"[Mock] {state.snapshot()}")
+    except KeyboardInterrupt:
+        server.shutdown()
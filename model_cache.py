@@ -0,0 +1,107 @@
+import time
+import sqlite3
+import hashlib
+import threading
+
+
+def content_key(data):
+    """图片等内容数据的 sha256"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def prompt_key(prompt, model):
+    """提示词 + 模型名的哈希，提示词或模型变化后旧结果自然失效"""
+    return hashlib.sha256(f"{model}\0{prompt}".encode("utf-8")).hexdigest()[:16]
+
+
+class ModelCache:
+    """
+    基于 SQLite 的模型响应缓存
+    - 键：内容哈希 + 提示词/模型哈希
+    - 过期：超过 ttl 秒的记录视为无效
+    - 淘汰：超过条数上限或总字节数上限时按最近使用时间 (LRU) 删除
+    """
+
+    def __init__(self, path, ttl=30 * 24 * 3600, max_entries=100000, max_bytes=None):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                content_key TEXT NOT NULL,
+                prompt_key  TEXT NOT NULL,
+                response    TEXT NOT NULL,
+                created_at  REAL NOT NULL,
+                last_used   REAL NOT NULL,
+                PRIMARY KEY (content_key, prompt_key)
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON responses(last_used)")
+        self.db.commit()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def reset_stats(self):
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, ckey, pkey):
+        """命中返回缓存的响应文本，否则返回 None"""
+        now = time.time()
+        with self._lock:
+            row = self.db.execute(
+                "SELECT response, created_at FROM responses WHERE content_key=? AND prompt_key=?",
+                (ckey, pkey)).fetchone()
+            if row and (not self.ttl or now - row[1] <= self.ttl):
+                self.db.execute(
+                    "UPDATE responses SET last_used=? WHERE content_key=? AND prompt_key=?",
+                    (now, ckey, pkey))
+                self.db.commit()
+                self.stats["hits"] += 1
+                return row[0]
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, ckey, pkey, response):
+        now = time.time()
+        with self._lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                (ckey, pkey, response, now, now))
+            self._evict(now)
+            self.db.commit()
+
+    def _evict(self, now):
+        if self.ttl:
+            self.db.execute("DELETE FROM responses WHERE created_at < ?", (now - self.ttl,))
+        total = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        if total > self.max_entries:
+            self.db.execute(
+                "DELETE FROM responses WHERE rowid IN "
+                "(SELECT rowid FROM responses ORDER BY last_used LIMIT ?)",
+                (total - self.max_entries,))
+        if self.max_bytes:
+            size = self.db.execute("SELECT COALESCE(SUM(LENGTH(CAST(response AS BLOB))), 0) FROM responses").fetchone()[0]
+            if size > self.max_bytes:
+                # 从最久未使用的记录开始累计，删除到总量回到上限以内
+                rows = self.db.execute(
+                    "SELECT rowid, LENGTH(CAST(response AS BLOB)) FROM responses ORDER BY last_used").fetchall()
+                drop = []
+                for rowid, n in rows:
+                    if size <= self.max_bytes:
+                        break
+                    drop.append((rowid,))
+                    size -= n
+                self.db.executemany("DELETE FROM responses WHERE rowid=?", drop)
+
+    def invalidate_prompt(self, pkey):
+        """删除某个提示词/模型组合下的全部记录，返回删除条数"""
+        with self._lock:
+            cur = self.db.execute("DELETE FROM responses WHERE prompt_key=?", (pkey,))
+            self.db.commit()
+            return cur.rowcount
+
+    def close(self):
+        with self._lock:
+            self.db.close()
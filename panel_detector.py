@@ -0,0 +1,119 @@
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+MAX_SIDE = 256          # 检测前缩放到的最长边
+EDGE_THRESHOLD = 24     # 相邻像素灰度差超过该值视为边缘
+GUTTER_DENSITY = 0.02   # 整行/整列边缘占比低于该值视为候选分隔带
+GUTTER_STD = 12.0       # 整行/整列灰度标准差低于该值视为候选分隔带
+MIN_PANEL_RATIO = 0.08  # 单格占边长比例下限，过窄的分段视为横幅/留白而非格子
+FLAT_EDGE_DENSITY = 0.01  # 整图边缘占比低于该值视为几乎没有线条结构 (纯色 / 大面积留白)
+
+
+def _load_gray(img, max_side=MAX_SIDE):
+    if not isinstance(img, Image.Image):
+        img = Image.open(BytesIO(img))
+    img = img.convert("L")
+    img.thumbnail((max_side, max_side), Image.BILINEAR)
+    return np.asarray(img, dtype=np.float32)
+
+
+def _runs(mask):
+    """返回布尔序列中连续 True 段的 (起点, 终点) 列表，终点不含"""
+    padded = np.concatenate(([False], mask, [False])).astype(np.int8)
+    diff = np.diff(padded)
+    return list(zip(np.flatnonzero(diff == 1), np.flatnonzero(diff == -1)))
+
+
+def _split(density, std, length):
+    """
+    根据投影剖面切分格子
+    返回各格子的长度列表
+    """
+    gutter = (density < GUTTER_DENSITY) & (std < GUTTER_STD)
+    # 去掉贴边的留白，只保留内部的分隔带
+    cuts = [(s + e) / 2 for s, e in _runs(gutter) if s > 0 and e < length]
+    # 丢弃会产生过窄分段的切线（通常是标题横幅或边框双线）
+    min_len = length * MIN_PANEL_RATIO
+    bounds = [0.0]
+    for c in cuts:
+        if c - bounds[-1] >= min_len:
+            bounds.append(c)
+    if len(bounds) > 1 and length - bounds[-1] < min_len:
+        bounds.pop()
+    bounds.append(float(length))
+    return np.diff(bounds)
+
+
+def _regularity(sizes):
+    """格子尺寸越均匀越接近 1"""
+    if len(sizes) < 2:
+        return 1.0
+    cv = float(np.std(sizes) / max(np.mean(sizes), 1e-6))
+    return max(0.0, 1.0 - cv * 2)
+
+
+def detect_panels(img, max_side=MAX_SIDE):
+    """
+    基于行/列投影剖面与边缘密度的本地版式检测
+    返回 {"rows", "cols", "verdict", "confidence"}，verdict 为是否六格漫画
+    """
+    px = _load_gray(img, max_side)
+    h, w = px.shape
+    gx = np.abs(np.diff(px, axis=1)) > EDGE_THRESHOLD
+    gy = np.abs(np.diff(px, axis=0)) > EDGE_THRESHOLD
+    edges = np.zeros_like(px, dtype=bool)
+    edges[:, 1:] |= gx
+    edges[1:, :] |= gy
+
+    row_sizes = _split(edges.mean(axis=1), px.std(axis=1), h)
+    col_sizes = _split(edges.mean(axis=0), px.std(axis=0), w)
+    rows, cols = len(row_sizes), len(col_sizes)
+    reg = min(_regularity(row_sizes), _regularity(col_sizes))
+
+    if (rows, cols) in ((2, 3), (3, 2)):
+        verdict, conf = True, 0.75 + 0.25 * reg
+    elif rows * cols == 6:
+        verdict, conf = True, 0.5 + 0.2 * reg
+    elif rows == 1 and cols == 1:
+        # 没找到分隔带本身不能说明是单图 (例如格子之间是细黑线而非留白)，
+        # 只有整图几乎没有线条结构时才给出高置信度，否则交给模型
+        verdict, conf = False, (0.85 if edges.mean() < FLAT_EDGE_DENSITY else 0.5)
+    else:
+        verdict, conf = False, 0.4 + 0.4 * reg
+    return {"rows": rows, "cols": cols, "verdict": verdict, "confidence": round(conf, 3)}
+
+
+class PanelPrefilter:
+    """
+    六格漫画本地预筛：置信度达到阈值时直接给出结论，否则交给视觉模型
+    统计每次运行节省的 API 调用次数，便于调整阈值
+    """
+
+    def __init__(self, threshold=0.8):
+        self.threshold = threshold
+        self.stats = {"local_yes": 0, "local_no": 0, "ambiguous": 0, "errors": 0}
+
+    def judge(self, img):
+        """返回 (结论, 检测结果)，结论为 None 表示需要调用模型"""
+        try:
+            res = detect_panels(img)
+        except Exception:
+            self.stats["errors"] += 1
+            return None, None
+        if res["confidence"] >= self.threshold:
+            self.stats["local_yes" if res["verdict"] else "local_no"] += 1
+            return res["verdict"], res
+        self.stats["ambiguous"] += 1
+        return None, res
+
+    @property
+    def saved_calls(self):
+        return self.stats["local_yes"] + self.stats["local_no"]
+
+    def report(self):
+        total = self.saved_calls + self.stats["ambiguous"] + self.stats["errors"]
+        return (f"本地预筛 {total} 张 | 判定是 {self.stats['local_yes']} / 否 {self.stats['local_no']} | "
+                f"转交模型 {self.stats['ambiguous'] + self.stats['errors']} | 节省 API 调用 {self.saved_calls} 次 "
+                f"(阈值 {self.threshold})")
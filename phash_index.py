@@ -0,0 +1,134 @@
+import os
+import json
+import threading
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+HASH_SIZE = 8        # 输出 8x8 = 64 位哈希
+DCT_SIZE = 32        # pHash 先缩放到 32x32 再做 DCT
+
+
+def _gray(img, size):
+    """转灰度并缩放，返回 float32 矩阵 (高, 宽)"""
+    if not isinstance(img, Image.Image):
+        img = Image.open(BytesIO(img))
+    img = img.convert("L").resize(size, Image.BILINEAR)
+    return np.asarray(img, dtype=np.float32)
+
+
+def _pack(bits):
+    """布尔矩阵按行优先打包成 Python int"""
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def dhash(img, hash_size=HASH_SIZE):
+    """差值哈希：比较相邻像素亮度"""
+    px = _gray(img, (hash_size + 1, hash_size))
+    return _pack(px[:, 1:] > px[:, :-1])
+
+
+def _dct_matrix(n):
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * x + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    m[0] /= np.sqrt(2.0)
+    return m.astype(np.float32)
+
+
+_DCT = _dct_matrix(DCT_SIZE)
+
+
+def phash(img, hash_size=HASH_SIZE):
+    """感知哈希：二维 DCT 低频系数与中位数比较，对缩放和重新压缩不敏感"""
+    px = _gray(img, (DCT_SIZE, DCT_SIZE))
+    low = (_DCT @ px @ _DCT.T)[:hash_size, :hash_size]
+    # 直流分量只反映整体亮度，不参与中位数计算
+    med = np.median(low.ravel()[1:])
+    return _pack(low > med)
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """按汉明距离组织的 BK 树，支持半径检索"""
+
+    def __init__(self):
+        self.root = None  # 节点结构: [hash, payload, {距离: 子节点}]
+        self.size = 0
+
+    def add(self, h, payload):
+        self.size += 1
+        if self.root is None:
+            self.root = [h, payload, {}]
+            return
+        node = self.root
+        while True:
+            d = hamming(h, node[0])
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, payload, {}]
+                return
+            node = child
+
+    def search(self, h, radius):
+        """返回 [(距离, hash, payload)]，按距离升序"""
+        found = []
+        stack = [self.root] if self.root else []
+        while stack:
+            node = stack.pop()
+            d = hamming(h, node[0])
+            if d <= radius:
+                found.append((d, node[0], node[1]))
+            # 三角不等式：只有距离落在 [d-r, d+r] 的子树可能命中
+            for cd, child in node[2].items():
+                if d - radius <= cd <= d + radius:
+                    stack.append(child)
+        return sorted(found, key=lambda x: x[0])
+
+
+class PHashIndex:
+    """
+    持久化的近重复图片索引
+    每条记录追加写入 JSONL 文件，启动时重建 BK 树
+    """
+
+    def __init__(self, path, radius=6):
+        self.path = path
+        self.radius = radius
+        self.tree = BKTree()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "added": 0}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                        self.tree.add(int(rec["hash"], 16), rec)
+                    except (ValueError, KeyError):
+                        continue
+
+    def __len__(self):
+        return self.tree.size
+
+    def lookup(self, h):
+        """返回半径内最近的历史记录，没有则返回 None"""
+        with self._lock:
+            found = self.tree.search(h, self.radius)
+        if not found:
+            return None
+        self.stats["hits"] += 1
+        d, _, rec = found[0]
+        return {**rec, "distance": d}
+
+    def add(self, h, href, verdict):
+        """记录一张图片的判定结果 (accepted / rejected)"""
+        rec = {"hash": f"{h:016x}", "href": href, "verdict": verdict}
+        with self._lock:
+            self.tree.add(h, rec)
+            self.stats["added"] += 1
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(rec, ensure_ascii=False) + "\n")
@@ -1,8 +1,17 @@
 import os
+import re
 import csv
 import base64
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
-from openai import OpenAI
+from dashscope_client import get_client, scheduler
+from image_encoder import PayloadEncoder
+from model_cache import ModelCache, content_key, prompt_key
+from task_worker import progress
+from tracer import span
 
 # 加载环境变量并配置 API 密钥
 load_dotenv()
@@ -12,33 +21,35 @@ if not api_key:
     print("[Error] 未在 .env 文件中找到有效密钥 (DASHSCOPE_API_KEY)")
     exit(1)
 
-# 初始化模型客户端
-client = OpenAI(
-    api_key=api_key,
-    base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
-)
+# 共享的模型客户端（与 spider.py 复用同一连接池）
+client = get_client(api_key)
 
-def encode_image_to_base64(image_path):
-    """辅助函数：执行本地文件到 Base64 编码的转换"""
-    try:
-        with open(image_path, "rb") as image_file:
-            return base64.b64encode(image_file.read()).decode("utf-8")
-    except Exception as e:
-        print(f"[Warning] 图像编码失败: {image_path} | {e}")
-        return None
+# --- 载荷压缩配置 ---
+MAX_EDGE = 1280          # 发送前图片最长边
+PAYLOAD_FORMAT = "JPEG"  # 重新编码格式：JPEG / WEBP
+PAYLOAD_QUALITY = 85     # 重新编码质量
+# ---------------
 
-def generate_batch_story(image_paths):
-    """
-    聚合多张图片上下文，单次调用模型生成连贯文案
-    """
-    print(f"[Logic] 正在处理图像序列（共计 {len(image_paths)} 帧）...")
-    
-    # 使用提示词确保输出纯净
-    content_list = [
-        {
-            "type": "text", 
-            "text": (
-                '''
+encoder = PayloadEncoder(MAX_EDGE, PAYLOAD_FORMAT, PAYLOAD_QUALITY)
+
+# --- 文案缓存配置 ---
+STORY_CACHE_PATH = "story_cache.db"
+STORY_CACHE_TTL_DAYS = 30             # 缓存有效期
+STORY_CACHE_MAX_BYTES = 50 * 1024 * 1024  # 缓存文案总大小上限
+# ---------------
+
+# 相同图片序列 + 相同提示词 + 相同模型的生成结果直接复用
+story_cache = ModelCache(STORY_CACHE_PATH, STORY_CACHE_TTL_DAYS * 86400, max_bytes=STORY_CACHE_MAX_BYTES)
+
+STORY_MODEL = "qwen-vl-plus"
+
+# --- 流式生成配置 ---
+STREAM_MODE = True       # 流式生成，出现违规格式立即中止
+FORMAT_RETRIES = 2       # 格式违规后的重试次数（最后一次不中止，完整返回）
+# ---------------
+
+# 故事改写提示词
+STORY_PROMPT = '''
 你现在是纯文本小说作者，严禁使用任何 Markdown 语法。
 请严格遵守以下所有限制条件，否则视为严重违规：
 
@@ -65,30 +76,224 @@ def generate_batch_story(image_paths):
 第三部分：五个标签，用逗号分隔，例如：标签1, 标签2, 标签3, 标签4, 标签5
 
 现在请根据我给你的图片顺序，创作一个完整连贯的故事。'''
-            )
+
+def encode_image_to_base64(image_path):
+    """辅助函数：执行本地文件到 Base64 编码的转换"""
+    try:
+        with open(image_path, "rb") as image_file:
+            return base64.b64encode(image_file.read()).decode("utf-8")
+    except Exception as e:
+        print(f"[Warning] 图像编码失败: {image_path} | {e}")
+        return None
+
+class FormatGuard:
+    """
+    增量检查模型输出是否符合「标题 / 空行 / 正文 / 空行 / 标签」纯文本结构
+    feed 在出现违规时立即返回原因，finish 在生成结束后检查整体结构
+    """
+
+    BANNED = ("*", "#", "```", "---")
+    LIST_PREFIX = re.compile(r'^\s*([-*>]|\d+[.、)]\s)')
+    TITLE_BANNED = set('"\'《》*#()[]（）【】“”')
+
+    def __init__(self):
+        self.text = ""
+        self.checked_lines = 0
+
+    def feed(self, delta):
+        self.text += delta
+        # 只需检查新增内容附近，留出跨块拼接的余量
+        tail = self.text[-(len(delta) + 3):]
+        for token in self.BANNED:
+            if token in tail:
+                return f"出现禁用符号 {token}"
+        lines = self.text.split("\n")
+        for i in range(self.checked_lines, len(lines) - 1):
+            reason = self._check_line(i, lines[i])
+            if reason:
+                return reason
+        self.checked_lines = len(lines) - 1
+        return None
+
+    def _check_line(self, i, line):
+        if self.LIST_PREFIX.match(line):
+            return "出现列表/引用标记"
+        if i == 0:
+            title = line.strip()
+            if not title:
+                return "首行不是标题"
+            if any(c in self.TITLE_BANNED for c in title) or title.startswith(("标题", "以下是")):
+                return "标题含多余符号或说明"
+        if i == 1 and line.strip():
+            return "标题后缺少空行"
+        return None
+
+    def finish(self):
+        # 补查最后一行（流结束时可能没有换行符）
+        lines = self.text.split("\n")
+        for i in range(self.checked_lines, len(lines)):
+            reason = self._check_line(i, lines[i])
+            if reason:
+                return reason
+        lines = self.text.strip().split("\n")
+        if len(lines) < 5:
+            return "结构不完整"
+        if lines[-2].strip():
+            return "标签行前缺少空行"
+        if len([t for t in re.split(r'[,，]', lines[-1]) if t.strip()]) < 3:
+            return "标签行格式错误"
+        return None
+
+# 流式生成统计：请求数、中止次数、首字延迟 (秒)
+stream_stats = {"requests": 0, "aborted": 0, "ttft": []}
+_stats_lock = threading.Lock()
+
+def stream_story(messages, retries=FORMAT_RETRIES):
+    """
+    流式生成文案，边接收边检查格式，违规立即中止请求并重试
+    返回 (文案, 是否通过格式检查)
+    """
+    for attempt in range(retries + 1):
+        last = attempt == retries
+        guard = FormatGuard()
+        violation = None
+        first = None
+        sent = {}
+
+        def create(**kwargs):
+            # 首字延迟从请求真正发出时计时，不包含限速、退避与熔断的排队等待
+            sent["at"] = time.time()
+            return client.chat.completions.create(**kwargs)
+        stream = scheduler.call(create, model=STORY_MODEL, messages=messages, stream=True)
+        try:
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ""
+                if not delta:
+                    continue
+                if first is None:
+                    first = time.time() - sent["at"]
+                violation = violation or guard.feed(delta)
+                if violation and not last:
+                    break
+        finally:
+            stream.close()
+        with _stats_lock:
+            stream_stats["requests"] += 1
+            if first is not None:
+                stream_stats["ttft"].append(first)
+        violation = violation or guard.finish()
+        if violation is None:
+            return guard.text, True
+        if last:
+            print(f"[Stream] 重试 {retries} 次后仍不符合格式 ({violation})，保留最后一次结果")
+            return guard.text, False
+        with _stats_lock:
+            stream_stats["aborted"] += 1
+        print(f"[Stream] 第 {attempt + 1} 次生成格式违规 ({violation})，已中止并重试")
+
+def stream_report():
+    ttft = sorted(stream_stats["ttft"])
+    if not ttft:
+        return "[Stream] 无流式请求"
+    p50 = ttft[len(ttft) // 2]
+    return (f"[Stream] 请求 {stream_stats['requests']} 次 | 格式违规中止 {stream_stats['aborted']} 次 | "
+            f"首字延迟 p50 {p50:.2f}s / 最大 {ttft[-1]:.2f}s")
+
+def reset_run_stats():
+    """清零各项统计：模块在控制台的常驻任务进程中只导入一次，每次运行开始时调用"""
+    scheduler.reset_stats()
+    encoder.reset_stats()
+    story_cache.reset_stats()
+    with _stats_lock:
+        stream_stats.update(requests=0, aborted=0, ttft=[])
+
+def frames_key(image_paths):
+    """按顺序组合每帧的内容哈希，帧顺序变化也会得到不同的键"""
+    digests = []
+    for path in image_paths:
+        with open(path, "rb") as f:
+            digests.append(content_key(f.read()))
+    return content_key("\n".join(digests).encode("utf-8"))
+
+def invalidate_story_cache(prompt_text=STORY_PROMPT, model=STORY_MODEL):
+    """只清除某一版提示词的缓存结果，其他提示词的缓存保留"""
+    removed = story_cache.invalidate_prompt(prompt_key(prompt_text, model))
+    print(f"[Cache] 已清除 {removed} 条文案缓存")
+    return removed
+
+def generate_batch_story(image_paths, encoder=encoder, cache=story_cache):
+    """
+    聚合多张图片上下文，单次调用模型生成连贯文案
+    图片经 encoder 缩放、重新编码后发送；encoder 为 None 时发送原图
+    cache 命中 (同一帧序列 + 提示词 + 模型) 时直接返回历史结果
+    调用失败 (重试耗尽) 时返回 None
+    """
+    print(f"[Logic] 正在处理图像序列（共计 {len(image_paths)} 帧）...")
+
+    ckey = None
+    if cache is not None:
+        try:
+            with span("cache_lookup"):
+                ckey = frames_key(image_paths)
+                cached = cache.get(ckey, prompt_key(STORY_PROMPT, STORY_MODEL))
+            if cached is not None:
+                print("[Cache] 命中文案缓存")
+                return cached
+        except OSError as e:
+            print(f"[Warning] 缓存键计算失败: {e}")
+    
+    # 使用提示词确保输出纯净
+    content_list = [
+        {
+            "type": "text", 
+            "text": STORY_PROMPT
         }
     ]
     
     # 填充多图数据到消息列表
     for path in image_paths:
-        base64_img = encode_image_to_base64(path)
-        if base64_img:
+        with span("encode"):
+            if encoder is not None:
+                url = encoder.encode(path)
+            else:
+                base64_img = encode_image_to_base64(path)
+                url = f"data:image/jpeg;base64,{base64_img}" if base64_img else None
+        if url:
             content_list.append({
                 "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{base64_img}"}
+                "image_url": {"url": url}
             })
 
+    messages = [{"role": "user", "content": content_list}]
     try:
         # 调度多模态模型进行视觉推理
-        completion = client.chat.completions.create(
-            model="qwen-vl-plus", 
-            messages=[{"role": "user", "content": content_list}],
-        )
-        return completion.choices[0].message.content
+        with span("generate", frames=len(image_paths)):
+            if STREAM_MODE:
+                story, valid = stream_story(messages)
+            else:
+                completion = scheduler.call(
+                    client.chat.completions.create,
+                    model=STORY_MODEL, 
+                    messages=messages,
+                )
+                story, valid = completion.choices[0].message.content, True
+        if ckey and valid:
+            cache.put(ckey, prompt_key(STORY_PROMPT, STORY_MODEL), story)
+        return story
     except Exception as e:
-        return f"[API Error] 调用异常: {str(e)}"
+        # 失败时不再返回错误文本，避免写入 CSV 后被当作文案发布
+        print(f"[API Error] 调用异常: {str(e)}")
+        return None
+
+def list_images(folder):
+    """按文件名中的数字顺序列出图片 (1.jpg, 2.jpg ... 10.jpg)，保证故事叙事顺序"""
+    files = [f for f in os.listdir(folder) if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
+    return sorted(files, key=lambda f: [int(t) if t.isdigit() else t for t in re.split(r'(\d+)', f)])
 
 def main():
+    reset_run_stats()
     # --- 路径定义 ---
     image_folder = "images"  
     output_file = "series_story.csv" 
@@ -99,10 +304,7 @@ def main():
         return
         
     # 按名称排序以保证故事叙事顺序 (1.jpg, 2.jpg...)
-    image_files = sorted([
-        f for f in os.listdir(image_folder) 
-        if f.lower().endswith(('.png', '.jpg', '.jpeg'))
-    ])
+    image_files = list_images(image_folder)
     
     if not image_files:
         print("[Notice] 目标文件夹内未发现图片资产")
@@ -113,6 +315,10 @@ def main():
 
     # 执行批处理生成
     story_content = generate_batch_story(all_image_paths)
+    if story_content is None:
+        print("[Error] 文案生成失败，未写入结果文件")
+        print(scheduler.report())
+        return
 
     # 保存到本地
     with open(output_file, mode='w', encoding='utf-8-sig', newline='') as f:
@@ -120,7 +326,98 @@ def main():
         writer.writerow(["图片文件名", "生成的文案"])
         writer.writerow([", ".join(image_files), story_content])
 
+    print(encoder.report())
+    print(f"[Cache] 文案缓存命中 {story_cache.stats['hits']} 次, 未命中 {story_cache.stats['misses']} 次")
+    if STREAM_MODE:
+        print(stream_report())
+    print(scheduler.report())
     print(f"\n>>> 任务结束。文案已导出至: {output_file}")
 
+def load_finished(output_file):
+    """读取批量结果文件中已成功生成的文件夹，失败行不计入以便重试"""
+    done = set()
+    if os.path.exists(output_file):
+        with open(output_file, 'r', encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                if not row.get("生成的文案", "").startswith("[API Error]"):
+                    done.add(os.path.normpath(row["文件夹"]))
+    return done
+
+def batch_main(root="RedComic_Final_Fixed", folders=None, workers=4, output_file="batch_story.csv"):
+    """
+    批量模式：为 root 下每个 note_N 文件夹（或指定的文件夹列表）并发生成文案
+    每完成一个即追加写入 output_file，重启后自动跳过已完成的文件夹
+    """
+    reset_run_stats()
+    if folders is None:
+        if not os.path.isdir(root):
+            print(f"[Error] 指定目录不存在: {root}")
+            return
+        folders = sorted(
+            (e.path for e in os.scandir(root) if e.is_dir() and re.fullmatch(r'note_\d+', e.name)),
+            key=lambda p: int(p.rsplit('_', 1)[1])
+        )
+
+    done = load_finished(output_file)
+    todo = [f for f in folders if os.path.normpath(f) not in done]
+    print(f"[Batch] 共 {len(folders)} 个文件夹，已完成 {len(folders) - len(todo)} 个，本次处理 {len(todo)} 个 (并发 {workers})")
+    if not todo:
+        return
+
+    file_exists = os.path.exists(output_file)
+    lock = threading.Lock()
+    with open(output_file, mode='a', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        if not file_exists:
+            writer.writerow(["文件夹", "图片文件名", "生成的文案"])
+
+        def run(folder):
+            image_files = list_images(folder)
+            if not image_files:
+                return folder, image_files, None
+            return folder, image_files, generate_batch_story([os.path.join(folder, n) for n in image_files])
+
+        finished = 0
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(run, folder) for folder in todo]
+            for fut in as_completed(futures):
+                try:
+                    folder, image_files, story = fut.result()
+                except Exception as e:
+                    print(f"[Warning] 处理失败: {e}")
+                    continue
+                if not image_files:
+                    print(f"[Notice] 目标文件夹内未发现图片资产: {folder}")
+                    continue
+                if story is None:
+                    print(f"[Warning] 文案生成失败，下次运行重试: {folder}")
+                    continue
+                with lock, span("write"):
+                    writer.writerow([folder, ", ".join(image_files), story])
+                    f.flush()
+                finished += 1
+                print(f"[Batch] ({finished}/{len(todo)}) 完成: {folder}")
+                progress(finished, len(todo), "改写")
+
+    print(encoder.report())
+    print(f"[Cache] 文案缓存命中 {story_cache.stats['hits']} 次, 未命中 {story_cache.stats['misses']} 次")
+    if STREAM_MODE:
+        print(stream_report())
+    print(scheduler.report())
+    print(f"\n>>> 批量任务结束。文案已追加至: {output_file}")
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="AI 故事改写")
+    parser.add_argument("--batch", action="store_true", help="批量处理 RedComic_Final_Fixed 下的所有 note_N 文件夹")
+    parser.add_argument("--workers", type=int, default=4, help="批量模式并发数")
+    parser.add_argument("--root", default="RedComic_Final_Fixed", help="批量模式扫描的根目录")
+    parser.add_argument("--output", default="batch_story.csv", help="批量模式输出文件")
+    parser.add_argument("--invalidate-cache", action="store_true", help="清除当前提示词的文案缓存后退出")
+    parser.add_argument("folders", nargs="*", help="批量模式下只处理这些文件夹")
+    args = parser.parse_args()
+    if args.invalidate_cache:
+        invalidate_story_cache()
+    elif args.batch or args.folders:
+        batch_main(args.root, args.folders or None, args.workers, args.output)
+    else:
+        main()
\ No newline at end of file
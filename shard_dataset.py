@@ -0,0 +1,128 @@
+import os
+import json
+import mmap
+
+import numpy as np
+
+# 分片格式：
+#   shard-00000.bin  依次存放每条记录的 [标注 JSON][图片字节]
+#   shard-00000.idx  每条记录一行 (偏移, 标注长度, 图片长度)，小端 uint64，可直接 memmap
+#   manifest.json    分片列表与记录数
+INDEX_DTYPE = np.dtype('<u8')
+
+
+class ShardWriter:
+    """按固定大小切分的数据集写入器，分片写满后才以原子重命名落盘"""
+
+    def __init__(self, out_dir, shard_bytes=256 << 20, prefix="shard"):
+        self.out_dir = out_dir
+        self.shard_bytes = shard_bytes
+        self.prefix = prefix
+        self.shards = []
+        self._f = None
+        self._index = []
+        self._size = 0
+        os.makedirs(out_dir, exist_ok=True)
+
+    def _path(self, n, ext):
+        return os.path.join(self.out_dir, f"{self.prefix}-{n:05d}.{ext}")
+
+    def _roll(self):
+        """结束当前分片：写索引并把临时文件改为正式文件名"""
+        if self._f is None:
+            return
+        n = len(self.shards)
+        self._f.close()
+        np.asarray(self._index, dtype=INDEX_DTYPE).reshape(-1, 3).tofile(self._path(n, "idx.tmp"))
+        os.replace(self._path(n, "idx.tmp"), self._path(n, "idx"))
+        os.replace(self._path(n, "bin.tmp"), self._path(n, "bin"))
+        self.shards.append({"name": f"{self.prefix}-{n:05d}", "count": len(self._index), "bytes": self._size})
+        self._f, self._index, self._size = None, [], 0
+
+    def add(self, meta, data):
+        """追加一条记录：meta 为标注字典，data 为图片原始字节"""
+        meta_b = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+        if self._size and self._size + len(meta_b) + len(data) > self.shard_bytes:
+            self._roll()
+        if self._f is None:
+            self._f = open(self._path(len(self.shards), "bin.tmp"), "wb")
+        self._index.append((self._size, len(meta_b), len(data)))
+        self._f.write(meta_b)
+        self._f.write(data)
+        self._size += len(meta_b) + len(data)
+
+    def close(self):
+        self._roll()
+        manifest = {"format": 1, "shards": self.shards, "count": sum(s["count"] for s in self.shards)}
+        tmp = os.path.join(self.out_dir, "manifest.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, os.path.join(self.out_dir, "manifest.json"))
+        return manifest
+
+
+class ShardReader:
+    """
+    随机访问读取器：索引 memmap、分片 mmap，按需打开
+    reader[i] 只读取第 i 条记录对应的字节，不解析整个分片；可在 DataLoader 的多个 worker 中各自创建
+    """
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        with open(os.path.join(out_dir, "manifest.json"), "r", encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        self.names = [s["name"] for s in self.manifest["shards"]]
+        self._index = [np.memmap(os.path.join(out_dir, f"{n}.idx"), dtype=INDEX_DTYPE, mode="r").reshape(-1, 3)
+                       if s["count"] else np.zeros((0, 3), dtype=INDEX_DTYPE)
+                       for n, s in zip(self.names, self.manifest["shards"])]
+        self._starts = np.cumsum([0] + [len(ix) for ix in self._index])
+        self._maps = {}
+
+    def __len__(self):
+        return int(self._starts[-1])
+
+    def _map(self, shard):
+        mm = self._maps.get(shard)
+        if mm is None:
+            with open(os.path.join(self.out_dir, f"{self.names[shard]}.bin"), "rb") as f:
+                mm = self._maps[shard] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return mm
+
+    def locate(self, i):
+        """第 i 条记录所在的 (分片序号, 偏移, 标注长度, 图片长度)"""
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        shard = int(np.searchsorted(self._starts, i, side="right")) - 1
+        off, meta_len, img_len = (int(v) for v in self._index[shard][i - self._starts[shard]])
+        return shard, off, meta_len, img_len
+
+    def meta(self, i):
+        shard, off, meta_len, _ = self.locate(i)
+        return json.loads(self._map(shard)[off:off + meta_len])
+
+    def __getitem__(self, i):
+        """返回 (标注字典, 图片字节)"""
+        shard, off, meta_len, img_len = self.locate(i)
+        mm = self._map(shard)
+        return json.loads(mm[off:off + meta_len]), mm[off + meta_len:off + meta_len + img_len]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def close(self):
+        for mm in self._maps.values():
+            mm.close()
+        self._maps.clear()
+
+
+def export_shards(records, out_dir, shard_mb=256):
+    """
+    把 (标注字典, 图片路径) 序列打包为分片数据集，返回 manifest
+    records 可以是生成器，图片逐张读入写出，不整体载入内存
+    """
+    writer = ShardWriter(out_dir, int(shard_mb * (1 << 20)))
+    for meta, path in records:
+        with open(path, "rb") as f:
+            writer.add(meta, f.read())
+    return writer.close()
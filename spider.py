@@ -1,15 +1,24 @@
 import os
 import csv
 import time
-import requests
 import json
 import shutil
 import re
-from PIL import Image
-from io import BytesIO
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import urlparse
 from DrissionPage import ChromiumPage, ChromiumOptions
-from openai import OpenAI
 from dotenv import load_dotenv
+from image_fetcher import ImageFetcher
+from image_store import ImageStore
+from phash_index import PHashIndex, phash
+from model_cache import ModelCache, content_key, prompt_key
+from panel_detector import PanelPrefilter
+from crawl_state import CrawlState, next_note_index
+from dashscope_client import get_client, get_async_client, scheduler
+from task_worker import progress
+from tracer import span
 
 # 加载环境变量配置文件
 load_dotenv()
@@ -19,22 +28,31 @@ def get_config():
     with open("app_config.json", "r", encoding="utf-8") as f:
         return json.load(f)
 
-# 六格漫画识别提示词
-prompt = """请严格判断这张图片是否为典型的「六格漫画」：
-要求：
+# 六格漫画判定标准，单图与打包识别共用
+SIX_PANEL_RULES = """要求：
 1. 必须是一张完整的大图
 2. 里面清楚地划分出正好 6 个矩形（或近似矩形）漫画格子
 3. 通常为 2×3 或 3×2 排列，也可能是其他六等分方式
 4. 每个格子内通常有独立的漫画画面、人物或剧情片段
 
-不符合以上任意一条就视为不是。
+不符合以上任意一条就视为不是。"""
+
+# 六格漫画识别提示词
+prompt = f"""请严格判断这张图片是否为典型的「六格漫画」：
+{SIX_PANEL_RULES}
 只回答以下两种之一，不要输出任何其他文字：
 是
 否"""
 
-def is_quality_ok(img_url, text_content, min_resolution, min_text_len):
+# 打包识别提示词：一次请求判断多张图片，按编号逐行作答
+PACKED_PROMPT = """下面按顺序给出 {n} 张图片，每张图片前标有「图片 编号」。请逐张严格判断是否为典型的「六格漫画」：
+""" + SIX_PANEL_RULES + """
+按编号逐行回答，共 {n} 行，每行格式为「编号: 是」或「编号: 否」，不要输出任何其他文字。"""
+
+def is_quality_ok(img_url, text_content, min_resolution, min_text_len, fetcher=None):
     """
     基础质量过滤：检查分辨率和文本长度
+    分辨率只读取图片头部获取，不下载完整文件
     """
     # 1. 文本长度校验 (匹配中文字符)
     chinese_chars = re.findall(r'[\u4e00-\u9fa5]', text_content)
@@ -43,16 +61,14 @@ def is_quality_ok(img_url, text_content, min_resolution, min_text_len):
         return False
 
     # 2. 分辨率校验
+    fetcher = fetcher or ImageFetcher()
     try:
-        headers = {'User-Agent': 'Mozilla/5.0', 'Referer': 'https://www.xiaohongshu.com/'}
-        response = requests.get(img_url, headers=headers, timeout=5)
-        if response.status_code == 200:
-            img = Image.open(BytesIO(response.content))
-            width, height = img.size
-            if width < min_resolution or height < min_resolution:
-                print(f"  - [跳过] 分辨率过低 ({width}x{height} < {min_resolution}p)")
-                return False
-        else:
+        size = fetcher.probe_size(img_url, timeout=5)
+        if not size:
+            return False
+        width, height = size
+        if width < min_resolution or height < min_resolution:
+            print(f"  - [跳过] 分辨率过低 ({width}x{height} < {min_resolution}p)")
             return False
     except Exception as e:
         print(f"  ! 分辨率检测异常: {e}")
@@ -60,37 +76,351 @@ def is_quality_ok(img_url, text_content, min_resolution, min_text_len):
 
     return True
 
-def is_six_panel_comic(img_url, api_key):
-    """使用视觉模型判断图片是否为六格漫画"""
+VL_MODEL = "qwen-vl-plus"
+
+def _vl_messages(img_url):
+    return [{"role": "user", "content": [
+        {"type": "text", "text": prompt},
+        {"type": "image_url", "image_url": {"url": img_url}}
+    ]}]
+
+def lookup_verdict(img_url, fetcher=None, cache=None):
+    """
+    按图片内容哈希 + 提示词/模型哈希查询历史判定
+    返回 (内容哈希, 判定)，未命中时判定为 None
+    """
+    if cache is None:
+        return None, None
+    fetcher = fetcher or ImageFetcher()
+    data = fetcher.fetch(img_url, timeout=10)
+    if not data:
+        return None, None
+    ckey = content_key(data)
+    res = cache.get(ckey, prompt_key(prompt, VL_MODEL))
+    return ckey, (None if res is None else "是" in res)
+
+def _classify_one(img_url, api_key, ckey=None, cache=None):
+    """单图调用视觉模型并回写缓存，调用失败 (重试耗尽) 时返回 None"""
+    try:
+        # 共享的 Qwen-VL 客户端，经调度器限速、重试
+        with span("vl_call", images=1):
+            completion = scheduler.call(
+                get_client(api_key).chat.completions.create,
+                model=VL_MODEL, messages=_vl_messages(img_url)
+            )
+        res = completion.choices[0].message.content
+        if ckey and cache is not None:
+            cache.put(ckey, prompt_key(prompt, VL_MODEL), res)
+        return "是" in res
+    except Exception as e:
+        # 不再把失败当作通过：返回 None，由调用方记为失败并在下次运行重试
+        print(f"  ! AI 识别异常: {e}")
+        return None 
+
+def is_six_panel_comic(img_url, api_key, fetcher=None, cache=None):
+    """
+    使用视觉模型判断图片是否为六格漫画，调用失败 (重试耗尽) 时返回 None
+    传入 cache 时先按图片内容哈希 + 提示词/模型哈希查询历史判定，命中则不再调用接口
+    """
     if not api_key: 
         return True
+
+    ckey, verdict = lookup_verdict(img_url, fetcher, cache)
+    if verdict is not None:
+        print("  > 命中历史判定缓存")
+        return verdict
+    return _classify_one(img_url, api_key, ckey, cache)
+
+async def is_six_panel_comic_async(img_url, api_key, ckey=None, cache=None):
+    """
+    is_six_panel_comic 的异步版本，供 AsyncRunner 并发调用
+    缓存查询 (需要下载图片) 应由调用方先通过 lookup_verdict 完成，这里只负责模型调用与回写
+    """
+    if not api_key:
+        return True
     try:
-        # 初始化Qwen-VL客户端
-        client = OpenAI(api_key=api_key, base_url="https://dashscope.aliyuncs.com/compatible-mode/v1")
-        completion = client.chat.completions.create(
-            model="qwen-vl-plus",
-            messages=[{"role": "user", "content": [
-                {"type": "text", "text": prompt},
-                {"type": "image_url", "image_url": {"url": img_url}}
-            ]}]
-        )
+        with span("vl_call", images=1):
+            completion = await scheduler.acall(
+                get_async_client(api_key).chat.completions.create,
+                model=VL_MODEL, messages=_vl_messages(img_url)
+            )
         res = completion.choices[0].message.content
+        if ckey and cache is not None:
+            cache.put(ckey, prompt_key(prompt, VL_MODEL), res)
         return "是" in res
     except Exception as e:
         print(f"  ! AI 识别异常: {e}")
-        return True 
+        return None
+
+_SLOT_RE = re.compile(r'^\W*(?:图片\s*)?(\d+)\s*[:：.、)）]?\s*(是|否)', re.M)
+
+# 打包识别统计：请求数、覆盖图片数、解析失败后逐张补判的图片数
+packed_stats = {"requests": 0, "images": 0, "fallback": 0}
+_packed_lock = threading.Lock()
+
+def _packed_messages(img_urls):
+    content = [{"type": "text", "text": PACKED_PROMPT.format(n=len(img_urls))}]
+    for i, url in enumerate(img_urls, 1):
+        content.append({"type": "text", "text": f"图片 {i}"})
+        content.append({"type": "image_url", "image_url": {"url": url}})
+    return [{"role": "user", "content": content}]
+
+def parse_packed_verdicts(text, n):
+    """
+    从打包识别的回复中解析每个编号的判定，返回 {编号: 是否六格}
+    编号越界的行忽略；同一编号出现相互矛盾的结论时视为未解析
+    """
+    verdicts, conflicts = {}, set()
+    for m in _SLOT_RE.finditer(text or ""):
+        i, v = int(m.group(1)), m.group(2) == "是"
+        if not 1 <= i <= n:
+            continue
+        if verdicts.get(i, v) != v:
+            conflicts.add(i)
+        verdicts[i] = v
+    for i in conflicts:
+        verdicts.pop(i)
+    return verdicts
+
+def is_six_panel_comic_batch(img_urls, api_key, ckeys=None, cache=None):
+    """
+    一次请求判断多张图片，返回与 img_urls 等长的判定列表 (True / False / None)
+    回复中没能解析出结论的图片逐张回退到单图识别；整批调用失败时全部返回 None
+    缓存查询应由调用方先通过 lookup_verdict 完成，解析出的结论按单图提示词的键回写
+    """
+    if not api_key:
+        return [True] * len(img_urls)
+    ckeys = ckeys or [None] * len(img_urls)
+    if len(img_urls) == 1:
+        return [_classify_one(img_urls[0], api_key, ckeys[0], cache)]
+    try:
+        with span("vl_call", images=len(img_urls)):
+            completion = scheduler.call(
+                get_client(api_key).chat.completions.create,
+                model=VL_MODEL, messages=_packed_messages(img_urls),
+                est_tokens=scheduler.default_tokens * len(img_urls)
+            )
+        verdicts = parse_packed_verdicts(completion.choices[0].message.content, len(img_urls))
+    except Exception as e:
+        print(f"  ! AI 打包识别异常: {e}")
+        return [None] * len(img_urls)
+
+    missing = [i for i in range(1, len(img_urls) + 1) if i not in verdicts]
+    with _packed_lock:
+        packed_stats["requests"] += 1
+        packed_stats["images"] += len(img_urls)
+        packed_stats["fallback"] += len(missing)
+    if missing:
+        print(f"  ! 打包识别回复无法解析 {len(missing)}/{len(img_urls)} 张，改为逐张识别")
+    results = []
+    for i, (url, ckey) in enumerate(zip(img_urls, ckeys), 1):
+        if i in verdicts:
+            if ckey and cache is not None:
+                cache.put(ckey, prompt_key(prompt, VL_MODEL), "是" if verdicts[i] else "否")
+            results.append(verdicts[i])
+        else:
+            results.append(_classify_one(url, api_key, ckey, cache))
+    return results
+
+def packed_report():
+    images = max(packed_stats["images"], 1)
+    return (f"[Packed] 打包请求 {packed_stats['requests']} 次, 覆盖 {packed_stats['images']} 张 | "
+            f"逐张回退 {packed_stats['fallback']} 张 ({packed_stats['fallback'] / images:.1%})")
+
+class PackedClassifier:
+    """
+    打包识别：工作线程提交的图片先攒成一批，凑满 batch_size 张或等待超过 max_wait 秒后合并为一次请求
+    submit 立即返回 concurrent.futures.Future，用法与 AsyncRunner 一致；最多 concurrency 批同时在途
+    """
+
+    def __init__(self, api_key, batch_size=4, max_wait=2.0, cache=None, concurrency=2):
+        self.api_key = api_key
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait
+        self.cache = cache
+        self._pending = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=concurrency)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, img_url, ckey=None):
+        fut = Future()
+        self._pending.put((img_url, ckey, fut))
+        return fut
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._pending.get()
+            if item is None:
+                break
+            batch, deadline = [item], time.monotonic() + self.max_wait
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._pending.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._pool.submit(self._flush, batch)
+
+    def _flush(self, batch):
+        urls, ckeys, futs = zip(*batch)
+        try:
+            results = is_six_panel_comic_batch(list(urls), self.api_key, list(ckeys), self.cache)
+        except Exception as e:
+            for fut in futs:
+                fut.set_exception(e)
+            return
+        for fut, res in zip(futs, results):
+            fut.set_result(res)
 
-def download_img(url, folder, name):
-    """下载图片到指定文件夹"""
-    headers = {'User-Agent': 'Mozilla/5.0', 'Referer': 'https://www.xiaohongshu.com/'}
+    def close(self):
+        self._pending.put(None)
+        self._thread.join(timeout=10)
+        self._pool.shutdown(wait=True)
+
+def check_duplicate(img_url, index, fetcher=None):
+    """
+    计算首图感知哈希并在历史索引中查找近重复
+    返回 (哈希, 命中记录)，首图获取失败时哈希为 None
+    """
+    fetcher = fetcher or ImageFetcher()
+    try:
+        data = fetcher.fetch(img_url, timeout=10)
+        if not data:
+            return None, None
+        h = phash(data)
+    except Exception as e:
+        print(f"  ! 感知哈希计算异常: {e}")
+        return None, None
+    return h, index.lookup(h)
+
+class HostLimiter:
+    """按域名限制同时进行的下载数，避免对单个 CDN 节点并发过高"""
+
+    def __init__(self, per_host=4):
+        self.per_host = per_host
+        self._sems = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            sem = self._sems.get(host)
+            if sem is None:
+                sem = self._sems[host] = threading.BoundedSemaphore(self.per_host)
+        return sem
+
+def download_img(url, folder, name, fetcher=None, store=None, limiter=None):
+    """
+    下载图片到指定文件夹
+    数据流式写入内容寻址仓库并校验可解码，note 文件夹中只保存对仓库文件的引用
+    """
+    fetcher = fetcher or ImageFetcher()
+    store = store or ImageStore(os.path.dirname(folder))
     try:
-        res = requests.get(url, headers=headers, timeout=10)
-        if res.status_code == 200:
-            with open(os.path.join(folder, f"{name}.jpg"), 'wb') as f:
-                f.write(res.content)
-            return True
+        if limiter is None:
+            return store.save(fetcher.iter_content(url, timeout=10), os.path.join(folder, f"{name}.jpg")) is not None
+        with limiter(url):
+            return store.save(fetcher.iter_content(url, timeout=10), os.path.join(folder, f"{name}.jpg")) is not None
     except: return False
-    return False
+
+class OrderedCommitter:
+    """
+    按笔记被提取的先后顺序提交结果
+    工作线程乱序完成，这里缓存结果并按序号依次分配 note_N、移动临时文件夹、写入 metadata.csv
+    """
+
+    def __init__(self, save_path, writer, csv_f, limit, dup_index, start_idx=0, state=None):
+        self.save_path = save_path
+        self.state = state
+        self.writer, self.csv_f = writer, csv_f
+        self.limit = limit
+        self.dup_index = dup_index
+        self.last_idx = start_idx
+        self.count = 0
+        self.issued = 0        # 已发出的序号数
+        self.next_seq = 0      # 下一个待提交的序号
+        self._done = {}
+        self.cond = threading.Condition()
+
+    def issue(self):
+        with self.cond:
+            seq = self.issued
+            self.issued += 1
+            return seq
+
+    @property
+    def in_flight(self):
+        return self.issued - self.next_seq
+
+    def finish(self, seq, note):
+        """工作线程上报结果，note 为 None 表示被过滤或下载失败"""
+        with self.cond:
+            self._done[seq] = note
+            while self.next_seq in self._done:
+                try:
+                    self._commit(self._done.pop(self.next_seq))
+                except Exception as e:
+                    print(f"  ! 提交异常: {e}")
+                # 提交失败也必须推进序号，否则后续结果永远等不到提交，wait_all 一直阻塞
+                self.next_seq += 1
+            self.cond.notify_all()
+
+    def _commit(self, note):
+        if note is None:
+            return
+        if self.count >= self.limit:
+            shutil.rmtree(note["tmp_folder"], ignore_errors=True)
+            return
+        try:
+            with span("commit"):
+                self._write(note)
+        except Exception as e:
+            print(f"  ! [失败] 保存笔记异常，下次运行重试: {note['href']} | {e}")
+            shutil.rmtree(note["tmp_folder"], ignore_errors=True)
+            if note.get("new_folder"):
+                shutil.rmtree(note["new_folder"], ignore_errors=True)
+            if self.state is not None:
+                self.state.record(note["href"], "failed", "commit")
+            return
+        print(f"  + [成功] 第 {self.last_idx} 组保存完成: {note['title'][:10]}...")
+        progress(self.count, self.limit, "采集")
+
+    def _write(self, note):
+        """把临时文件夹移动为 note_N 并写入索引与 CSV"""
+        self.last_idx += 1
+        note_idx = self.last_idx
+        folder = os.path.join(self.save_path, f"note_{note_idx}")
+        if not os.path.exists(folder):
+            os.replace(note["tmp_folder"], folder)
+            note["new_folder"] = folder  # 后续步骤失败时整体删除，不留下没有 CSV 记录的 note_N
+        else:
+            for f in os.listdir(note["tmp_folder"]):
+                os.replace(os.path.join(note["tmp_folder"], f), os.path.join(folder, f))
+            shutil.rmtree(note["tmp_folder"], ignore_errors=True)
+        if note["img_hash"] is not None:
+            self.dup_index.add(note["img_hash"], note["href"], "accepted")
+        if self.state is not None:
+            self.state.record(note["href"], "accepted", note_idx=note_idx)
+        # 修改：保存数据中增加正文 note_desc
+        self.writer.writerow([note_idx, note["title"], note["desc"], note["href"], note["success_dl"]])
+        self.csv_f.flush()
+        self.count += 1
+
+    def wait_for_room(self):
+        """在途笔记已足以凑满目标时阻塞，直到有结果提交"""
+        with self.cond:
+            while self.count < self.limit and self.count + self.in_flight >= self.limit:
+                self.cond.wait(timeout=1)
+
+    def wait_all(self):
+        with self.cond:
+            while self.in_flight:
+                self.cond.wait(timeout=1)
 
 def clean_and_back(page, url):
     """清理当前页面并返回目标页面"""
@@ -103,6 +433,10 @@ def clean_and_back(page, url):
         page.get(url)
 
 def main():
+    # 常驻任务进程中模块只导入一次，每次运行开始时清零统计，报告只反映本次运行
+    scheduler.reset_stats()
+    with _packed_lock:
+        packed_stats.update(requests=0, images=0, fallback=0)
     # 获取配置参数
     conf = get_config()
     KEYWORD = conf.get("keyword", "抽卡漫画")
@@ -113,6 +447,18 @@ def main():
     USE_QUALITY_CHECK = conf.get("use_quality_check", False) # 基础过滤开关
     MIN_RES = int(conf.get("min_resolution", 500))       # 最低分辨率
     MIN_TEXT = int(conf.get("min_text_len", 10))         # 最低中文字数
+    USE_DEDUP = conf.get("use_phash_dedup", True)        # 近重复图片跳过开关
+    DEDUP_RADIUS = int(conf.get("phash_radius", 6))      # 汉明距离阈值 (64 位)
+    CACHE_TTL_DAYS = float(conf.get("verdict_cache_ttl_days", 30))  # 判定缓存有效期
+    CACHE_MAX = int(conf.get("verdict_cache_max_entries", 100000))  # 判定缓存条数上限
+    USE_PREFILTER = conf.get("use_panel_prefilter", True)            # 本地六格版式预筛开关
+    PANEL_CONF = float(conf.get("panel_confidence", 0.8))            # 本地预筛置信度阈值
+    AI_CONCURRENCY = int(conf.get("ai_concurrency", 4))              # 打包识别同时在途的最大批数
+    WORKERS = int(conf.get("pipeline_workers", 4))                   # 过滤/下载工作线程数
+    QUEUE_SIZE = int(conf.get("pipeline_queue_size", 8))             # 待处理笔记队列上限
+    PER_HOST_DOWNLOADS = int(conf.get("per_host_downloads", 4))      # 单个 CDN 域名并发下载上限
+    BATCH_SIZE = int(conf.get("classify_batch_size", 1))             # 打包识别每批图片数，1 表示逐张识别
+    BATCH_WAIT = float(conf.get("classify_batch_wait", 2.0))         # 打包识别凑批最长等待秒数
     
     API_KEY = os.getenv("DASHSCOPE_API_KEY")
     SAVE_PATH = 'RedComic_Final_Fixed'
@@ -120,12 +466,21 @@ def main():
     # 初始化浏览器配置
     co = ChromiumOptions().set_argument('--disable-blink-features=AutomationControlled')
     page = ChromiumPage(co)
+    # 本次运行共享的图片获取层：质量检测与下载共用同一份数据
+    fetcher = ImageFetcher()
     
     print(f"任务启动 | 目标: {MAX_NOTES} | 基础过滤: {USE_QUALITY_CHECK} | AI识别: {USE_FILTER}")
     target_url = f'https://www.xiaohongshu.com/search_result?keyword={KEYWORD}'
     page.get(target_url)
     
     if not os.path.exists(SAVE_PATH): os.makedirs(SAVE_PATH)
+    store = ImageStore(SAVE_PATH)
+    # 历史判定过的首图感知哈希索引，跨运行持久化
+    dup_index = PHashIndex(os.path.join(SAVE_PATH, 'phash_index.jsonl'), DEDUP_RADIUS)
+    # 视觉模型判定缓存，重复采集同一关键词时几乎不再调用接口
+    verdict_cache = ModelCache(os.path.join(SAVE_PATH, 'verdict_cache.db'), CACHE_TTL_DAYS * 86400, CACHE_MAX)
+    # 本地版式预筛，只有拿不准的图片才交给视觉模型
+    prefilter = PanelPrefilter(PANEL_CONF)
     
     # 检查文件是否存在以决定是否写入表头
     csv_path = f'{SAVE_PATH}/metadata.csv'
@@ -137,9 +492,133 @@ def main():
     if not file_exists:
         writer.writerow(['序号', '标题', '正文', '链接', '图片数量'])
 
-    count, history, scroll = 0, set(), 0
+    # 跨运行的访问记录：已有定论的笔记直接跳过，序号接着已有目录继续
+    state = CrawlState(os.path.join(SAVE_PATH, 'crawl_state.db'))
+    start_idx = next_note_index(SAVE_PATH)
+    print(f"已载入历史记录 {len(state)} 条 | 新笔记从 note_{start_idx + 1} 开始编号")
+
+    # 生产者/消费者流水线：浏览器只负责提取笔记，过滤、识别与下载交给工作线程
+    committer = OrderedCommitter(SAVE_PATH, writer, csv_f, MAX_NOTES, dup_index, start_idx, state)
+    limiter = HostLimiter(PER_HOST_DOWNLOADS)
+    note_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    # 逐张识别由工作线程直接调用共享客户端，并发数即 pipeline_workers
+    # 打包识别：多条笔记的首图合并为一次请求，最多 ai_concurrency 批同时在途
+    packer = PackedClassifier(API_KEY, BATCH_SIZE, BATCH_WAIT, verdict_cache, AI_CONCURRENCY) \
+        if USE_FILTER and BATCH_SIZE > 1 else None
+
+    def classify(note):
+        """第三步：本地预筛 -> 判定缓存 -> 视觉模型"""
+        url = note["img_urls"][0]
+        if USE_PREFILTER:
+            with span("image_fetch"):
+                first = fetcher.fetch(url, timeout=10)
+            if first:
+                with span("prefilter"):
+                    is_comic, layout = prefilter.judge(first)
+                if is_comic is not None:
+                    print(f"  > 本地预筛: {layout['rows']}x{layout['cols']} 格 (置信度 {layout['confidence']})")
+                    note["local_verdict"] = True
+                    return is_comic
+        if packer:
+            ckey, is_comic = lookup_verdict(url, fetcher, verdict_cache)
+            if is_comic is not None:
+                print("  > 命中历史判定缓存")
+                return is_comic
+            print(f"  > 正在进行 AI 识别: {note['href']}")
+            return packer.submit(url, ckey).result()
+        print(f"  > 正在进行 AI 识别: {note['href']}")
+        return is_six_panel_comic(url, API_KEY, fetcher, verdict_cache)
+
+    def process(note):
+        """对单条笔记执行过滤与下载，通过返回笔记记录，否则返回 None"""
+        img_urls = note["img_urls"]
+        # 第一步：基础质量过滤 (分辨率 + 字数)
+        if USE_QUALITY_CHECK and img_urls:
+            with span("quality"):
+                ok = is_quality_ok(img_urls[0], note["desc"], MIN_RES, MIN_TEXT, fetcher)
+            if not ok:
+                state.record(note["href"], "rejected", "quality")
+                return None
+
+        # 第二步：近重复检测，转载过的漫画直接跳过，不再调用模型或下载
+        if USE_DEDUP and img_urls:
+            with span("dedup"):
+                note["img_hash"], dup = check_duplicate(img_urls[0], dup_index, fetcher)
+            if dup:
+                print(f"  - [跳过] 与历史笔记近重复 (距离 {dup['distance']}, 历史判定: {dup['verdict']})")
+                state.record(note["href"], "rejected", "duplicate")
+                return None
+
+        # 第三步：如果前面的过滤通过且启用了AI过滤，则进行大模型识别
+        is_comic = True
+        if USE_FILTER and img_urls:
+            with span("classify"):
+                is_comic = classify(note)
+        if is_comic is None:
+            print(f"  ! [失败] AI 识别不可用，下次运行重试: {note['href']}")
+            state.record(note["href"], "failed", "classify")
+            return None
+        if not is_comic:
+            print(f"  - [跳过] 判定非六格漫画: {note['href']}")
+            if note.get("local_verdict"):
+                # 仅凭本地预筛的否定不作为定论：不写入近重复索引，下次运行 (例如调整阈值后) 仍会重新判断
+                state.record(note["href"], "skipped", "not_comic_local")
+                return None
+            if note["img_hash"] is not None:
+                dup_index.add(note["img_hash"], note["href"], "rejected")
+            state.record(note["href"], "rejected", "not_comic")
+            return None
+
+        # 目标已经凑满时不再下载
+        if committer.count >= MAX_NOTES:
+            return None
+
+        # 第四步：下载到临时文件夹，提交时再按顺序分配 note_N
+        tmp_folder = os.path.join(SAVE_PATH, f".tmp_note_{note['seq']}")
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+        os.makedirs(tmp_folder)
+        success_dl = 0
+        unique_urls = list(dict.fromkeys(img_urls))[:18]
+        for i, url in enumerate(unique_urls):
+            with span("download") as sp:
+                # download_img 内部吞掉异常、以返回值表示成败，失败需显式记入追踪
+                ok = bool(download_img(url, tmp_folder, f"{i+1}", fetcher, store, limiter))
+                sp["ok"] = ok
+            success_dl += ok
+
+        if success_dl == 0:
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+            print("  ! [失败] 未采集到有效图片，文件夹已清理")
+            state.record(note["href"], "failed", "download")
+            return None
+        note.update(tmp_folder=tmp_folder, success_dl=success_dl)
+        return note
+
+    def worker():
+        while True:
+            note = note_queue.get()
+            if note is None:
+                break
+            result = None
+            try:
+                result = process(note)
+            except Exception as e:
+                print(f"  ! 处理异常: {e}")
+            finally:
+                fetcher.forget(note["img_urls"])
+                committer.finish(note["seq"], result)
+
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(WORKERS)]
+    for t in workers: t.start()
+
+    history, scroll = set(), 0
     
-    while count < MAX_NOTES and scroll < 100:
+    while committer.count < MAX_NOTES and scroll < 100:
+        # 在途笔记足以凑满目标时，先等待结果而不是继续打开新笔记
+        committer.wait_for_room()
+        if committer.count >= MAX_NOTES:
+            break
+
         items = page.eles('.note-item')
         target_href, target_ele = None, None
 
@@ -148,6 +627,9 @@ def main():
                 anchor = item.ele('tag:a', timeout=0.1)
                 href = anchor.attr('href')
                 if href and href not in history:
+                    # 历史运行中已有定论的笔记不再打开
+                    if state.is_done(href):
+                        history.add(href); continue
                     if not item.ele('.play-icon', timeout=0.1): 
                         target_ele, target_href = item, href
                         break
@@ -161,75 +643,54 @@ def main():
             history.add(target_href)
             scroll = 0
             
-            target_ele.scroll.to_see(); target_ele.click()
-            popup = page.wait.ele_displayed('.note-container', timeout=8)
+            with span("dom_wait"):
+                target_ele.scroll.to_see(); target_ele.click()
+                popup = page.wait.ele_displayed('.note-container', timeout=8)
             if not popup:
                 clean_and_back(page, target_url); continue
 
-            # 提取图片链接
-            img_urls = []
-            media = popup.ele('.media-container')
-            if media:
-                for img in media.eles('tag:img'):
-                    src = img.attr('src')
-                    if src and 'xhscdn.com' in src and 'avatar' not in src:
-                        img_urls.append(src.split('?')[0])
-            
-            # 提取正文内容用于字数过滤和保存
-            note_desc = popup.ele('.desc').text if popup.ele('.desc') else ""
-            
-            # --- 过滤逻辑开始 ---
-            passed = True
-            
-            # 第一步：基础质量过滤 (分辨率 + 字数)
-            if USE_QUALITY_CHECK and img_urls:
-                if not is_quality_ok(img_urls[0], note_desc, MIN_RES, MIN_TEXT):
-                    passed = False
-            
-            # 第二步：如果基础过滤通过且启用了AI过滤，则进行大模型识别
-            if passed and USE_FILTER and img_urls:
-                print(f"  > 正在进行 AI 识别: {target_href}")
-                if not is_six_panel_comic(img_urls[0], API_KEY):
-                    print("  - [跳过] 判定非六格漫画")
-                    passed = False
-            
-            if not passed:
-                clean_and_back(page, target_url)
-                continue
-            # --- 过滤逻辑结束 ---
-
-            # 第三步：创建对应文件夹
-            note_idx = count + 1
-            temp_folder = os.path.join(SAVE_PATH, f"note_{note_idx}")
-            if not os.path.exists(temp_folder): os.makedirs(temp_folder)
-            
-            # 第四步：下载图片
-            success_dl = 0
-            unique_urls = list(dict.fromkeys(img_urls))[:18]
-            for i, url in enumerate(unique_urls):
-                if download_img(url, temp_folder, f"{i+1}"):
-                    success_dl += 1
-            
-            # 第五步：保存结果
-            if success_dl > 0:
-                title = popup.ele('.title').text if popup.ele('.title') else "无标题"
-                # 修改：保存数据中增加正文 note_desc
-                writer.writerow([note_idx, title, note_desc, target_href, success_dl])
-                csv_f.flush()
-                print(f"  + [成功] 第 {note_idx} 组保存完成: {title[:10]}...")
-                count += 1 
-            else:
-                if os.path.exists(temp_folder): shutil.rmtree(temp_folder)
-                print("  ! [失败] 未采集到有效图片，文件夹已清理")
+            with span("dom_extract"):
+                # 提取图片链接
+                img_urls = []
+                media = popup.ele('.media-container')
+                if media:
+                    for img in media.eles('tag:img'):
+                        src = img.attr('src')
+                        if src and 'xhscdn.com' in src and 'avatar' not in src:
+                            img_urls.append(src.split('?')[0])
 
+                # 提取正文与标题，交给工作线程处理（队列满时在此阻塞形成背压）
+                note_desc = popup.ele('.desc').text if popup.ele('.desc') else ""
+                title = popup.ele('.title').text if popup.ele('.title') else "无标题"
+            note_queue.put({"seq": committer.issue(), "href": target_href, "title": title,
+                            "desc": note_desc, "img_urls": img_urls, "img_hash": None})
             clean_and_back(page, target_url)
 
         except Exception as e:
             print(f"  ! 处理异常: {e}")
             clean_and_back(page, target_url)
 
+    # 等待剩余的在途笔记处理完毕
+    committer.wait_all()
+    for _ in workers: note_queue.put(None)
+    for t in workers: t.join()
+    if packer:
+        packer.close()
+
     csv_f.close()
-    print(f"\n任务结束 | 总计成功采集: {count}/{MAX_NOTES}")
+    fetcher.close()
+    verdict_cache.close()
+    state.close()
+    print(f"  (跳过历史笔记 {state.stats['skipped']} 条)")
+    print(f"  ({prefilter.report()})")
+    print(f"  ({scheduler.report()})")
+    if packer:
+        print(f"  ({packed_report()})")
+    print(f"  (判定缓存命中 {verdict_cache.stats['hits']} 次, 未命中 {verdict_cache.stats['misses']} 次)")
+    print(f"  (近重复跳过 {dup_index.stats['hits']} 条, 索引总量 {len(dup_index)})")
+    print(f"  (新增图片 {store.stats['stored']} 张, 去重 {store.stats['deduped']} 张, 损坏丢弃 {store.stats['rejected']} 张)")
+    print(f"  (CDN 请求 {fetcher.stats['requests']} 次, 流量 {fetcher.stats['bytes'] / 1024 / 1024:.1f} MB, 缓存命中 {fetcher.stats['hits']} 次)")
+    print(f"\n任务结束 | 总计成功采集: {committer.count}/{MAX_NOTES}")
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
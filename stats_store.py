@@ -0,0 +1,213 @@
+import re
+import time
+import sqlite3
+import threading
+
+# 互动数据列：CSV 中文列名 -> 数据库列名，顺序与笔记管理页一致
+METRICS = [("阅读", "views"), ("点赞", "likes"), ("收藏", "collects"), ("评论", "comments"), ("分享", "shares")]
+
+# 计数文本格式 (1,024 / 1.2w / 3万 / 5k)：先去掉 COUNT_STRIP 匹配的逗号与空白，再按 COUNT_PATTERN 匹配
+# visualize_stats.parse_counts 的向量化解析共用这组常量
+COUNT_STRIP = r'[,\s]'
+COUNT_PATTERN = r'^(\d*\.?\d+)([wW万kK]?)$'
+UNIT_SCALE = {'': 1, 'w': 10000, 'W': 10000, '万': 10000, 'k': 1000, 'K': 1000}
+_COUNT_RE = re.compile(COUNT_PATTERN)
+
+COLS = [col for _, col in METRICS]
+_COL_DEFS = ", ".join(f"{c} INTEGER NOT NULL" for c in COLS)
+_COL_LIST = ", ".join(COLS)
+
+
+def parse_count(text):
+    """把页面上的计数文本 (1,024 / 1.2w / 3万 / 5k) 转为整数，无法解析时返回 0"""
+    if isinstance(text, (int, float)):
+        return int(text)
+    m = _COUNT_RE.match(re.sub(COUNT_STRIP, "", str(text or "")))
+    if not m:
+        return 0
+    return int(round(float(m.group(1)) * UNIT_SCALE[m.group(2)]))
+
+
+def record_key(record):
+    """快照的笔记键：优先笔记 ID，缺失时退化为标题"""
+    return record.get("笔记ID") or f"title:{record.get('标题', '')}"
+
+
+class StatsStore:
+    """
+    只追加的互动数据时间序列库 (SQLite)
+    - snapshots：按 (笔记 ID, 采集时间) 存储计数，与上一条快照相同的记录不重复写入
+    - notes：每条笔记的标题、发布时间以及最近一次被采集到的时间
+    - 汇总表 (写入快照时增量更新，报表不再扫描全部快照)：
+      note_rollup 每条笔记的最新计数与快照数；note_daily 每条笔记每天的最后计数；
+      daily_totals 每天结束时全部笔记的计数合计
+    """
+
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                note_id     TEXT NOT NULL,
+                captured_at REAL NOT NULL,
+                views       INTEGER NOT NULL,
+                likes       INTEGER NOT NULL,
+                collects    INTEGER NOT NULL,
+                comments    INTEGER NOT NULL,
+                shares      INTEGER NOT NULL,
+                PRIMARY KEY (note_id, captured_at)
+            ) WITHOUT ROWID""")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS notes (
+                note_id    TEXT PRIMARY KEY,
+                title      TEXT,
+                publish    TEXT,
+                first_seen REAL NOT NULL,
+                last_seen  REAL NOT NULL
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_time ON snapshots(captured_at)")
+        self.db.execute(f"""
+            CREATE TABLE IF NOT EXISTS note_rollup (
+                note_id   TEXT PRIMARY KEY,
+                snapshots INTEGER NOT NULL,
+                first_at  REAL NOT NULL,
+                last_at   REAL NOT NULL,
+                {_COL_DEFS}
+            )""")
+        self.db.execute(f"""
+            CREATE TABLE IF NOT EXISTS note_daily (
+                note_id TEXT NOT NULL,
+                day     TEXT NOT NULL,
+                {_COL_DEFS},
+                PRIMARY KEY (note_id, day)
+            ) WITHOUT ROWID""")
+        self.db.execute(f"""
+            CREATE TABLE IF NOT EXISTS daily_totals (
+                day   TEXT PRIMARY KEY,
+                notes INTEGER NOT NULL,
+                {_COL_DEFS}
+            )""")
+        self.db.commit()
+        # 旧版本数据库只有快照表，首次打开时补算汇总表
+        has_snapshots = self.db.execute("SELECT 1 FROM snapshots LIMIT 1").fetchone()
+        if has_snapshots and not self.db.execute("SELECT 1 FROM note_rollup LIMIT 1").fetchone():
+            self.rebuild_rollups()
+
+    def _latest_counts(self, note_id):
+        return self.db.execute(f"SELECT {_COL_LIST} FROM note_rollup WHERE note_id=?", (note_id,)).fetchone()
+
+    def _roll(self, note_id, ts, counts, prev):
+        """把一条新快照计入各汇总表，prev 为该笔记上一条快照的计数 (新笔记为 None)"""
+        day = time.strftime("%Y-%m-%d", time.localtime(ts))
+        placeholders = ", ".join("?" * len(COLS))
+        self.db.execute(
+            f"INSERT INTO note_rollup VALUES (?, 1, ?, ?, {placeholders}) ON CONFLICT(note_id) DO UPDATE SET "
+            f"snapshots=snapshots+1, last_at=excluded.last_at, "
+            + ", ".join(f"{c}=excluded.{c}" for c in COLS), (note_id, ts, ts, *counts))
+        self.db.execute(f"INSERT OR REPLACE INTO note_daily VALUES (?, ?, {placeholders})", (note_id, day, *counts))
+        # 当天第一次写入时从最近一天的合计结转，再累加本条快照带来的变化量
+        self.db.execute(
+            f"INSERT OR IGNORE INTO daily_totals SELECT ?, notes, {_COL_LIST} FROM daily_totals "
+            "WHERE day<? ORDER BY day DESC LIMIT 1", (day, day))
+        self.db.execute(f"INSERT OR IGNORE INTO daily_totals VALUES (?, 0, {placeholders})", (day, *[0] * len(COLS)))
+        delta = [c - p for c, p in zip(counts, prev or [0] * len(COLS))]
+        self.db.execute(
+            "UPDATE daily_totals SET notes=notes+?, " + ", ".join(f"{c}={c}+?" for c in COLS) + " WHERE day=?",
+            (int(prev is None), *delta, day))
+
+    def rebuild_rollups(self):
+        """按时间顺序重放全部快照，重新计算汇总表"""
+        with self._lock:
+            for table in ("note_rollup", "note_daily", "daily_totals"):
+                self.db.execute(f"DELETE FROM {table}")
+            rows = self.db.execute(f"SELECT note_id, captured_at, {_COL_LIST} FROM snapshots ORDER BY captured_at").fetchall()
+            for note_id, ts, *counts in rows:
+                self._roll(note_id, ts, tuple(counts), self._latest_counts(note_id))
+            self.db.commit()
+
+    def append(self, records, captured_at=None):
+        """
+        写入一批采集结果 (fetch_interaction_stats 的记录字典)
+        返回 (新增快照数, 未变化跳过数)
+        """
+        now = captured_at or time.time()
+        added = unchanged = 0
+        with self._lock:
+            for r in records:
+                key = record_key(r)
+                counts = tuple(parse_count(r.get(cn)) for cn, _ in METRICS)
+                self.db.execute(
+                    "INSERT INTO notes VALUES (?, ?, ?, ?, ?) ON CONFLICT(note_id) DO UPDATE SET "
+                    "title=excluded.title, publish=COALESCE(NULLIF(excluded.publish, ''), notes.publish), "
+                    "last_seen=excluded.last_seen",
+                    (key, r.get("标题", ""), r.get("发布时间", ""), now, now))
+                prev = self._latest_counts(key)
+                if prev == counts:
+                    unchanged += 1
+                    continue
+                self.db.execute("INSERT OR REPLACE INTO snapshots VALUES (?, ?, ?, ?, ?, ?, ?)", (key, now, *counts))
+                self._roll(key, now, counts, prev)
+                added += 1
+            self.db.commit()
+        return added, unchanged
+
+    def _rows(self, sql, params=()):
+        with self._lock:
+            cur = self.db.execute(sql, params)
+            cols = [c[0] for c in cur.description]
+            return [dict(zip(cols, row)) for row in cur.fetchall()]
+
+    def latest(self):
+        """每条笔记的最新快照 (附标题、发布时间与最近采集时间)"""
+        return self._rows(f"""
+            SELECT r.note_id, r.last_at AS captured_at, {", ".join("r." + c for c in COLS)},
+                   n.title, n.publish, n.last_seen
+            FROM note_rollup r JOIN notes n ON n.note_id = r.note_id
+            ORDER BY n.last_seen DESC""")
+
+    def latest_records(self):
+        """最新快照转换为 fetch_interaction_stats 的记录格式 (中文列名)"""
+        records = []
+        for row in self.latest():
+            rec = {"笔记ID": "" if row["note_id"].startswith("title:") else row["note_id"], "标题": row["title"]}
+            rec.update({cn: row[col] for cn, col in METRICS})
+            rec["发布时间"] = row["publish"]
+            rec["采集时间"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(row["last_seen"]))
+            records.append(rec)
+        return records
+
+    def series(self, note_id, since=None):
+        """单条笔记的快照序列，按采集时间升序"""
+        return self._rows(
+            "SELECT * FROM snapshots WHERE note_id=? AND captured_at>=? ORDER BY captured_at",
+            (note_id, since or 0))
+
+    def daily_totals(self, since=None):
+        """每天的全部笔记计数合计，按日期升序"""
+        return self._rows("SELECT * FROM daily_totals WHERE day>=? ORDER BY day", (since or "",))
+
+    def note_daily(self, note_id):
+        """单条笔记每天的最后计数，按日期升序"""
+        return self._rows("SELECT * FROM note_daily WHERE note_id=? ORDER BY day", (note_id,))
+
+    def top_notes(self, n=5, by="views"):
+        """按最新计数排序的前 n 条笔记 (附标题)"""
+        if by not in COLS:
+            raise ValueError(f"未知指标: {by}")
+        return self._rows(
+            f"SELECT r.*, n.title FROM note_rollup r JOIN notes n ON n.note_id = r.note_id "
+            f"ORDER BY r.{by} DESC LIMIT ?", (n,))
+
+    def last_seen(self):
+        """{笔记键: 最近一次被采集到的时间}"""
+        with self._lock:
+            return dict(self.db.execute("SELECT note_id, last_seen FROM notes"))
+
+    def __len__(self):
+        with self._lock:
+            return self.db.execute("SELECT COUNT(*) FROM notes").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.db.close()
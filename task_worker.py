@@ -0,0 +1,207 @@
+import os
+import sys
+import time
+import queue
+import argparse
+import importlib
+import threading
+import traceback
+import subprocess
+from multiprocessing.connection import Listener, Client
+
+# 控制台按钮编号 -> (模块, 入口函数)
+STAGES = {
+    "1": ("spider", "main"),
+    "2": ("rewrite_images", "main"),
+    "3": ("auto_publish_batch", "start"),
+    "4": ("fetch_interaction_stats", "get_stats"),
+    "5": ("visualize_stats", "generate_report"),
+}
+# 工作进程启动后预先导入的模块 (auto_publish_batch 会启动浏览器；
+# rewrite_images 导入时会打开文案缓存库，只在真正执行改写时才导入)
+PRELOAD = ["spider", "fetch_interaction_stats", "visualize_stats"]
+
+AUTH_ENV = "TASK_WORKER_AUTHKEY"
+
+_emit = None  # 工作进程内向控制台发送事件的函数
+
+
+def progress(done, total=None, label=""):
+    """业务脚本上报进度；不在工作进程中运行时忽略"""
+    if _emit is not None:
+        _emit("progress", done, total, label)
+
+
+class _LineForwarder:
+    """替换工作进程的 stdout / stderr：按行转发给控制台，同时照常输出到终端"""
+
+    def __init__(self, stream, emit):
+        self.stream = stream
+        self.emit = emit
+        self._local = threading.local()
+
+    def write(self, s):
+        if self.stream:
+            self.stream.write(s)
+        buf = getattr(self._local, "buf", "") + s
+        *lines, self._local.buf = buf.split("\n")
+        for line in lines:
+            if line.strip():
+                self.emit("log", line.rstrip())
+        return len(s)
+
+    def flush(self):
+        if self.stream:
+            self.stream.flush()
+        buf = getattr(self._local, "buf", "")
+        if buf.strip():
+            self.emit("log", buf.rstrip())
+        self._local.buf = ""
+
+    def isatty(self):
+        return False
+
+
+def _run_stage(action_id, emit):
+    mod_name, fn_name = STAGES[action_id]
+    emit("start", action_id)
+    t = time.time()
+    try:
+        # 模块只在首次使用时导入，之后常驻内存
+        getattr(importlib.import_module(mod_name), fn_name)()
+        ok, err = True, ""
+    except BaseException as e:  # 业务脚本中的 sys.exit 也不应结束工作进程
+        traceback.print_exc()
+        ok, err = False, str(e) or type(e).__name__
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+    emit("done", action_id, ok, time.time() - t, err)
+
+
+def serve(address, authkey):
+    """工作进程主循环：逐个执行控制台下发的任务"""
+    global _emit
+    conn = Client(address, authkey=authkey)
+    lock = threading.Lock()
+
+    def emit(*event):
+        with lock:
+            try:
+                conn.send(event)
+            except (OSError, EOFError):
+                pass
+    _emit = emit
+    sys.stdout = _LineForwarder(sys.__stdout__, emit)
+    sys.stderr = _LineForwarder(sys.__stderr__, emit)
+    emit("ready", os.getpid())
+
+    for name in PRELOAD:
+        try:
+            importlib.import_module(name)
+        except BaseException as e:  # 例如缺少 API Key 时模块在导入阶段 sys.exit
+            print(f"预加载 {name} 失败: {e!r}")
+    while True:
+        try:
+            msg = conn.recv()
+        except (EOFError, OSError):
+            break
+        if msg is None:
+            break
+        _run_stage(msg, emit)
+
+
+class TaskWorker:
+    """
+    常驻任务进程：控制台只负责界面，业务脚本在独立进程中执行，模块导入一次后保持常驻
+    - 工作进程继承控制台的终端，业务脚本中的 input() 仍可在终端中作答
+    - 日志行、进度与任务状态通过本地连接回传，控制台每帧调用 poll() 取回
+    - 工作进程意外退出时，下次提交任务会自动重启
+    """
+
+    def __init__(self):
+        self.events = queue.Queue()
+        self.proc = None
+        self._conn = None
+        self._connected = threading.Event()
+        self.busy = False
+
+    def start(self):
+        authkey = os.urandom(16)
+        listener = Listener(("127.0.0.1", 0), authkey=authkey)
+        host, port = listener.address
+        env = {**os.environ, AUTH_ENV: authkey.hex(), "PYTHONUNBUFFERED": "1"}
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--address", f"{host}:{port}"], env=env)
+        self._connected.clear()
+        threading.Thread(target=self._pump, args=(listener,), daemon=True).start()
+
+    def _pump(self, listener):
+        """接收工作进程事件并放入队列"""
+        try:
+            conn = listener.accept()
+        except Exception as e:
+            self.events.put(("log", f"任务进程连接失败: {e}"))
+            return
+        finally:
+            listener.close()
+        self._conn = conn
+        self._connected.set()
+        while True:
+            try:
+                event = conn.recv()
+            except (EOFError, OSError):
+                break
+            if event[0] == "done":
+                self.busy = False
+            self.events.put(event)
+        self.busy = False
+        self.events.put(("exit", self.proc.poll() if self.proc else None))
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def submit(self, action_id):
+        """下发任务；工作进程忙碌时返回 False"""
+        if self.busy:
+            return False
+        if not self.alive():
+            self.start()
+        if not self._connected.wait(timeout=30):
+            self.events.put(("log", "任务进程启动超时"))
+            return False
+        self.busy = True
+        self._conn.send(action_id)
+        return True
+
+    def poll(self):
+        """取出当前所有待处理事件"""
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def close(self, timeout=5):
+        if self._conn is not None:
+            try:
+                self._conn.send(None)
+            except OSError:
+                pass
+        if self.alive():
+            try:
+                self.proc.wait(timeout=timeout)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="控制台任务进程 (由 main_dashboard 启动)")
+    parser.add_argument("--address", required=True, help="控制台监听地址 host:port")
+    args = parser.parse_args()
+    host, port = args.address.rsplit(":", 1)
+    # 以脚本方式启动时本文件是 __main__；业务脚本 import 的是 task_worker 模块，
+    # 必须在该模块上运行 serve，progress() 才能拿到回传函数
+    import task_worker
+    task_worker.serve((host, int(port)), bytes.fromhex(os.environ[AUTH_ENV]))
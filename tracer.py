@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import atexit
+import threading
+from collections import deque, defaultdict
+from contextlib import contextmanager
+
+# 追踪文件路径，设为空字符串可关闭追踪
+TRACE_PATH = os.getenv("TRACE_PATH", "trace.jsonl")
+TRACE_MAX_BYTES = 50 * 1024 * 1024   # 超过该大小时轮转为 .1
+FLUSH_INTERVAL = 1.0                 # 后台写盘间隔 (秒)
+
+
+class Tracer:
+    """
+    轻量级阶段耗时追踪：span 结束时记录一行 JSON
+    {"ts": 开始时间, "stage": 阶段名, "dur": 耗时秒数, "ok": 是否正常结束, "pid": 进程号, ...附加字段}
+    记录先进入内存缓冲，由后台线程每秒追加写入文件，不阻塞业务线程；写入后超过 TRACE_MAX_BYTES 时轮转
+    span 返回一个字典，可在块内写入 ok (例如吞掉异常、以返回值表示成败的函数) 或其他附加字段
+    """
+
+    def __init__(self, path=TRACE_PATH):
+        self.path = path
+        self.enabled = bool(path)
+        self._buf = []
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # 后台线程与退出时的写盘互斥
+        self._flusher = None
+
+    @contextmanager
+    def span(self, stage, **attrs):
+        extra = {}
+        if not self.enabled:
+            yield extra
+            return
+        start, t0, ok = time.time(), time.perf_counter(), True
+        try:
+            yield extra
+        except BaseException:
+            ok = False
+            raise
+        finally:
+            # 不修改 extra，块结束后调用方仍可读取其中的字段
+            fields = {k: v for k, v in extra.items() if k != "ok"}
+            self.record(stage, start, time.perf_counter() - t0, extra.get("ok", ok), **attrs, **fields)
+
+    def record(self, stage, start, dur, ok=True, **attrs):
+        if not self.enabled:
+            return
+        line = json.dumps({"ts": round(start, 3), "stage": stage, "dur": round(dur, 4), "ok": ok,
+                           "pid": os.getpid(), **attrs}, ensure_ascii=False)
+        with self._lock:
+            self._buf.append(line)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+                self._flusher.start()
+                atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(FLUSH_INTERVAL)
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            lines, self._buf = self._buf, []
+        if not lines:
+            return
+        with self._write_lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+                size = f.tell()
+            # 常驻任务进程中会长时间写入，每次写盘后检查大小
+            if size > TRACE_MAX_BYTES:
+                os.replace(self.path, self.path + ".1")
+
+
+tracer = Tracer()
+span = tracer.span
+
+
+def _percentile(sorted_values, p):
+    k = min(len(sorted_values) - 1, max(0, int(round(p / 100 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+class TraceMonitor:
+    """
+    增量读取追踪文件，统计最近 window 秒内各阶段的吞吐 (次/分)、p50 / p95 耗时与失败次数
+    每次 poll 只读取上次之后新追加的内容
+    """
+
+    def __init__(self, path=TRACE_PATH, window=300, backlog_bytes=1 << 20):
+        self.path = path
+        self.window = window
+        self.backlog_bytes = backlog_bytes
+        self._offset = None
+        self._partial = ""
+        self._spans = defaultdict(deque)
+
+    def _read_new(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        size = os.path.getsize(self.path)
+        if self._offset is None or size < self._offset:
+            # 首次读取或文件被轮转：只读取末尾一段历史
+            self._offset, self._partial = max(0, size - self.backlog_bytes), ""
+        if size == self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read(size - self._offset)
+        self._offset = size
+        *lines, self._partial = (self._partial + data.decode("utf-8", errors="ignore")).split("\n")
+        for line in lines:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            self._spans[rec["stage"]].append((rec["ts"] + rec["dur"], rec["dur"], rec.get("ok", True)))
+
+    def poll(self, now=None):
+        """返回 [(阶段, 次/分, p50, p95, 失败次数)]，按阶段名排序"""
+        self._read_new()
+        now = now or time.time()
+        rows = []
+        for stage, spans in self._spans.items():
+            while spans and now - spans[0][0] > self.window:
+                spans.popleft()
+            if not spans:
+                continue
+            durs = sorted(d for _, d, _ in spans)
+            failed = sum(1 for *_, ok in spans if not ok)
+            # 吞吐按实际覆盖的时间计算，刚开始运行时不被窗口长度稀释
+            covered = max(min(self.window, now - spans[0][0]), 60)
+            rows.append((stage, len(spans) * 60 / covered, _percentile(durs, 50), _percentile(durs, 95), failed))
+        return sorted(rows)
@@ -1,43 +1,203 @@
+import os
+import argparse
+
+import numpy as np
 import pandas as pd
+import matplotlib
+matplotlib.use("Agg")  # 无界面后端：定时任务 / 控制台后台线程中也能出图
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+from stats_store import StatsStore, COUNT_STRIP, COUNT_PATTERN, UNIT_SCALE
 
 # 设置中文字体
-plt.rcParams['font.sans-serif'] = ['SimHei'] 
-plt.rcParams['axes.unicode_minus'] = False 
+plt.rcParams['font.sans-serif'] = ['SimHei']
+plt.rcParams['axes.unicode_minus'] = False
+
+# 互动数据列，顺序与笔记管理页一致
+METRIC_COLS = ['阅读', '点赞', '收藏', '评论', '分享']
+
+STATS_DB_PATH = "interaction_stats.db"
+MAX_POINTS = 300    # 趋势线最多绘制的点数，历史再长出图耗时也保持不变
+TOP_NOTES = 5       # 增长趋势图展示的笔记数
+
+
+def parse_counts(values):
+    """
+    向量化解析计数列：1,024 / 1.2w / 3万 / 5k / 纯数字 -> int64
+    无法解析的值记为 0
+    """
+    s = pd.Series(values).astype(str).str.replace(COUNT_STRIP, '', regex=True)
+    parts = s.str.extract(COUNT_PATTERN)
+    num = pd.to_numeric(parts[0], errors='coerce').to_numpy(dtype=float)
+    scale = parts[1].map(UNIT_SCALE).to_numpy(dtype=float)
+    out = np.rint(np.nan_to_num(num * scale, nan=0.0)).astype(np.int64)
+    return pd.Series(out, index=values.index if isinstance(values, pd.Series) else None)
+
+
+def lttb(x, y, threshold=MAX_POINTS):
+    """
+    Largest-Triangle-Three-Buckets 降采样：保留首尾点，其余每个分桶选出与相邻点构成最大三角形的点
+    在大幅减少点数的同时保留折线的峰谷形状
+    """
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return x, y
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    idx = np.empty(threshold, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = (edges[i + 1], edges[i + 2]) if i + 2 < len(edges) else (n - 1, n)
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        idx[i + 1] = a
+    return x[idx], y[idx]
+
+
+def load_stats(csv_path):
+    """读取采集结果，所有互动数据列解析为整数"""
+    df = pd.read_csv(csv_path, dtype=str).fillna('')
+    for col in METRIC_COLS:
+        df[col] = parse_counts(df[col]) if col in df else 0
+    df['短标题'] = df['标题'].str[:10]
+    return df
+
+
+# --- 图表：每个函数在给定的 Figure 上作图 ---
+def chart_overview(fig, df):
+    """阅读量柱状图 + 点赞趋势折线"""
+    ax = fig.add_subplot()
+    ax.bar(df['短标题'], df['阅读'], color='skyblue', label='阅读量')
+    # 用折线图展示点赞趋势（放大5倍以便观察）
+    ax.plot(df['短标题'], df['点赞'] * 5, color='red', marker='o', label='点赞趋势(x5)')
+    ax.set_title('小红书笔记互动数据分析图', fontsize=16)
+    ax.set_xlabel('笔记标题(前10字)', fontsize=12)
+    ax.set_ylabel('数值', fontsize=12)
+    ax.tick_params(axis='x', labelrotation=45)
+    ax.legend()
+
+
+def chart_interactions(fig, df):
+    """各笔记的点赞 / 收藏 / 评论 / 分享分组柱状图"""
+    ax = fig.add_subplot()
+    cols = METRIC_COLS[1:]
+    x = np.arange(len(df))
+    width = 0.8 / len(cols)
+    for i, col in enumerate(cols):
+        ax.bar(x + i * width, df[col], width, label=col)
+    ax.set_xticks(x + 0.4 - width / 2, df['短标题'], rotation=45)
+    ax.set_title('互动数据对比', fontsize=16)
+    ax.legend()
 
-def generate_report(csv_path="interaction_data.csv"):
-    """生成数据可视化报告"""
-    try:
-        # 1. 读取数据文件
-        df = pd.read_csv(csv_path)
-        
-        # 数据清洗：处理带'w'的单位，转换为浮点数
-        for col in ['阅读', '点赞', '收藏']:
-            df[col] = df[col].astype(str).str.replace('w', '000').astype(float)
-
-        # 2. 创建图表
-        plt.figure(figsize=(12, 6))
-        
-        # 用柱状图展示阅读量
-        plt.bar(df['标题'].str[:10], df['阅读'], color='skyblue', label='阅读量')
-        
-        # 用折线图展示点赞趋势（放大5倍以便观察）
-        plt.plot(df['标题'].str[:10], df['点赞'] * 5, color='red', marker='o', label='点赞趋势(x5)')
-
-        plt.title('小红书笔记互动数据分析图', fontsize=16)
-        plt.xlabel('笔记标题(前10字)', fontsize=12)
-        plt.ylabel('数值', fontsize=12)
-        plt.xticks(rotation=45)  # 旋转x轴标签
-        plt.legend()  # 显示图例
-        plt.tight_layout()  # 调整布局
-
-        # 3. 保存图表并显示
-        plt.savefig('analysis_report.png')
-        print("📊 可视化报告已生成：analysis_report.png")
-        plt.show()
 
+def chart_engagement(fig, df):
+    """互动率：(点赞 + 收藏 + 评论 + 分享) / 阅读"""
+    ax = fig.add_subplot()
+    views = df['阅读'].to_numpy(dtype=float)
+    total = df[METRIC_COLS[1:]].to_numpy(dtype=float).sum(axis=1)
+    rate = np.divide(total, views, out=np.zeros_like(total), where=views > 0) * 100
+    order = np.argsort(rate)[::-1]
+    ax.barh(df['短标题'].to_numpy()[order], rate[order], color='orange')
+    ax.invert_yaxis()
+    ax.set_xlabel('互动率 (%)', fontsize=12)
+    ax.set_title('笔记互动率排行', fontsize=16)
+
+
+# 报表包含的图表：(输出文件名, 作图函数)
+CHARTS = [
+    ('analysis_report.png', chart_overview),
+    ('interaction_compare.png', chart_interactions),
+    ('engagement_rate.png', chart_engagement),
+]
+
+
+# --- 历史趋势图：基于快照库的汇总表，参数为 StatsStore ---
+def _plot_series(ax, ts, values, label):
+    x, y = lttb(ts, values)
+    ax.plot(pd.to_datetime(x, unit='s'), y, label=label)
+
+
+def chart_daily_totals(fig, store):
+    """全部笔记每日累计阅读 / 点赞"""
+    rows = store.daily_totals()
+    ts = (pd.to_datetime([r['day'] for r in rows]) - pd.Timestamp(0)).total_seconds()
+    ax = fig.add_subplot()
+    _plot_series(ax, ts, [r['views'] for r in rows], '阅读')
+    ax2 = ax.twinx()
+    x, y = lttb(ts, [r['likes'] for r in rows])
+    ax2.plot(pd.to_datetime(x, unit='s'), y, color='red', label='点赞')
+    ax.set_title('账号每日累计互动趋势', fontsize=16)
+    ax.set_ylabel('阅读', fontsize=12)
+    ax2.set_ylabel('点赞', fontsize=12)
+    fig.legend(loc='upper left')
+
+
+def chart_top_growth(fig, store):
+    """阅读量最高的几条笔记的阅读增长曲线 (按天汇总，读取量不随快照数增长)"""
+    ax = fig.add_subplot()
+    for note in store.top_notes(TOP_NOTES):
+        days = store.note_daily(note['note_id'])
+        ts = (pd.to_datetime([d['day'] for d in days]) - pd.Timestamp(0)).total_seconds()
+        _plot_series(ax, ts, [d['views'] for d in days], note['title'][:10])
+    ax.set_title(f'阅读量前 {TOP_NOTES} 笔记增长趋势', fontsize=16)
+    ax.set_ylabel('阅读', fontsize=12)
+    ax.legend()
+
+
+# 存在快照库时追加的历史趋势图
+HISTORY_CHARTS = [
+    ('daily_trend.png', chart_daily_totals),
+    ('top_notes_growth.png', chart_top_growth),
+]
+
+
+def render_charts(data, out_dir='.', charts=CHARTS, dpi=100):
+    """
+    一次性渲染全部图表到文件，data 为作图函数的数据参数 (DataFrame 或 StatsStore)
+    直接使用 Figure + Agg 画布，不经过 pyplot 的全局状态，可在任意线程调用
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    paths = []
+    for name, draw in charts:
+        fig = Figure(figsize=(12, 6))
+        FigureCanvasAgg(fig)
+        draw(fig, data)
+        fig.tight_layout()
+        path = os.path.join(out_dir, name)
+        fig.savefig(path, dpi=dpi)
+        paths.append(path)
+    return paths
+
+
+def generate_report(csv_path="interaction_data.csv", out_dir=".", db_path=STATS_DB_PATH):
+    """生成数据可视化报告，返回生成的图片路径列表；存在快照库时追加历史趋势图"""
+    try:
+        df = load_stats(csv_path)
+        if df.empty:
+            print("⚠️ 没有可用的数据")
+            return []
+        paths = render_charts(df, out_dir)
+        if db_path and os.path.exists(db_path):
+            store = StatsStore(db_path)
+            try:
+                paths += render_charts(store, out_dir, HISTORY_CHARTS)
+            finally:
+                store.close()
+        print(f"📊 可视化报告已生成：{', '.join(paths)}")
+        return paths
     except Exception as e:
         print(f"❌ 绘图失败，请确保已安装 pandas 和 matplotlib: {e}")
+        return []
 
 if __name__ == "__main__":
-    generate_report()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="生成互动数据可视化报告 (无界面)")
+    parser.add_argument("--csv", default="interaction_data.csv", help="采集结果 CSV")
+    parser.add_argument("--out", default=".", help="图片输出目录")
+    parser.add_argument("--db", default=STATS_DB_PATH, help="历史快照库，不存在时只输出当前数据图表")
+    args = parser.parse_args()
+    generate_report(args.csv, args.out, args.db)